@@ -0,0 +1,68 @@
+"""Compare errors, resolve, clean and last timings with and without errors and data table indexes.
+
+Usage:
+
+    python benchmarks/indexes.py [rows] [errors]
+"""
+
+import sys
+import time
+import datetime
+import tempfile
+import pathlib
+
+import databot
+from databot.db.serializers import serrow
+
+
+def timeit(func, repeat=100):
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def create(path, rows, errors, indexes):
+    bot = databot.Bot(str(path))
+    p1 = bot.define('p1')
+    p2 = bot.define('p2')
+    task = p2(p1)
+    state = task.get_state()
+    created = datetime.datetime(2000, 1, 1)
+    bot.engine.execute(p1.table.insert(), [
+        serrow(i, 'value', created=created + datetime.timedelta(minutes=i)) for i in range(rows)
+    ])
+    bot.engine.execute(p1.table.update().where(p1.table.c.id % 1000 == 0).values(created=datetime.datetime(2010, 1, 1)))
+    bot.engine.execute(bot.models.errors.insert(), [
+        dict(state_id=state.id, row_id=i * (rows // errors) + 1, retries=0, traceback='', created=created)
+        for i in range(errors)
+    ])
+    if not indexes:
+        for index in list(bot.models.errors.indexes) + list(p1.table.indexes):
+            if index.name != 'ix_%s_key' % p1.table.name:
+                index.drop(bot.engine)
+    return bot, p1, task
+
+
+def benchmark(path, rows, errors, indexes):
+    bot, p1, task = create(path, rows, errors, indexes)
+    step = rows // errors
+    return [
+        ('errors(key)', timeit(lambda i: list(task.errors(i * step)))),
+        ('errors.resolve(key)', timeit(lambda i: task.errors.resolve(i * step))),
+        ('last(key)', timeit(lambda i: p1.last(i * 97))),
+        ('clean(age)', timeit(lambda i: p1.clean(datetime.timedelta(days=3650), now=datetime.datetime(2010, 1, 1)))),
+    ]
+
+
+def main(rows=200000, errors=10000):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        before = benchmark(pathlib.Path(tmpdir) / 'before.db', rows, errors, indexes=False)
+        after = benchmark(pathlib.Path(tmpdir) / 'after.db', rows, errors, indexes=True)
+    print('%-20s %12s %12s' % ('operation', 'without, ms', 'with, ms'))
+    for (name, a), (_, b) in zip(before, after):
+        print('%-20s %12.2f %12.2f' % (name, a, b))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,68 @@
+"""Compare rendering Select queries with Select.render and with plans compiled by Select.compile.
+
+Usage:
+
+    python benchmarks/select_plans.py [rows] [items per page]
+
+Query is the one from examples/reddit.py and pages are generated to match it. Both variants parse each page only once,
+so only query evaluation is compared.
+"""
+
+import sys
+import time
+
+from databot import first
+from databot.db.utils import Row
+from databot.handlers.html import Select
+
+QUERY = [
+    '.thing.link', (
+        '.entry .title > a@href', {
+            'title': '.entry .title > a:text',
+            'score': '.midcol .score.likes@title',
+            'time': first(['.tagline time@datetime']),
+            'comments': '.entry a.comments:text',
+        }
+    )
+]
+
+ITEM = '''
+<div class="thing link">
+  <div class="midcol"><div class="score likes" title="%(n)d">%(n)d</div></div>
+  <div class="entry">
+    <p class="title"><a href="/r/news/%(n)d">Title %(n)d</a></p>
+    <p class="tagline"><time datetime="2017-01-01T00:00:%(n)02d">1 hour ago</time></p>
+    <a class="comments" href="/r/news/%(n)d/comments">%(n)d comments</a>
+  </div>
+</div>
+'''
+
+
+def create_row(items):
+    content = '<html><body>%s</body></html>' % ''.join(ITEM % {'n': n} for n in range(items))
+    return Row({'key': 'https://www.reddit.com/', 'value': {'content': content.encode('utf-8')}})
+
+
+def main(rows=200, items=25):
+    row = create_row(items)
+    select = Select(QUERY)
+    select.set_row(row)
+    html = select.html
+
+    variants = [
+        ('render', lambda: select.render(row, html, QUERY)),
+        ('compiled', lambda: select.key_plan(row, html)),
+    ]
+
+    assert variants[0][1]() == variants[1][1]()
+
+    print('%-12s %12s' % ('variant', 'rows/s'))
+    for name, func in variants:
+        start = time.perf_counter()
+        for i in range(rows):
+            func()
+        print('%-12s %12.0f' % (name, rows / (time.perf_counter() - start)))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
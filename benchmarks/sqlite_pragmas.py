@@ -0,0 +1,46 @@
+"""Compare append and rows throughput of SQLite with and without performance profile.
+
+Usage:
+
+    python benchmarks/sqlite_pragmas.py [rows] [batch size]
+
+Each batch is appended with a separate append call, so each batch is a separate transaction, same as BulkInsert
+flushes in a running task.
+"""
+
+import sys
+import time
+import tempfile
+import pathlib
+
+import databot
+
+
+def benchmark(path, sqlite_pragmas, rows, batchsize):
+    bot = databot.Bot(str(path), sqlite_pragmas=sqlite_pragmas)
+    pipe = bot.define('pages')
+    value = {'content': b'<html>' + b'x' * 2000 + b'</html>'}
+
+    start = time.perf_counter()
+    for i in range(0, rows, batchsize):
+        pipe.append([('https://example.com/%d' % j, value) for j in range(i, i + batchsize)])
+    append = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for row in pipe.rows():
+        row.value
+    read = time.perf_counter() - start
+
+    return rows / append, rows / read
+
+
+def main(rows=10000, batchsize=10):
+    print('%-12s %12s %12s' % ('profile', 'append/s', 'rows/s'))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, pragmas in [('default', None), ('performance', True)]:
+            append, read = benchmark(pathlib.Path(tmpdir) / ('%s.db' % name), pragmas, rows, batchsize)
+            print('%-12s %12.0f %12.0f' % (name, append, read))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
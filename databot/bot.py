@@ -19,10 +19,12 @@ from databot.db.services import get_pipe_tables
 class Bot(Task):
 
     def __init__(self, uri_or_engine='sqlite:///:memory:', *, debug=False, retry=False, limit=0, error_limit=None,
-                 verbosity=0, output=sys.stdout, models=None, initializer=None):
+                 verbosity=0, output=sys.stdout, models=None, initializer=None, workers=None, background_writes=False,
+                 sqlite_pragmas=None, shared_scan=False):
         super().__init__()
         self.path = pathlib.Path(sys.modules[self.__class__.__module__].__file__).resolve().parent
-        self.engine = get_engine(uri_or_engine, self.path)
+        self.sqlite_pragmas = sqlite_pragmas
+        self.engine = get_engine(uri_or_engine, self.path, sqlite_pragmas)
         self.models = models or Models(sa.MetaData(self.engine))
         self.output = Printer(self.models, output)
         self.conn = self.engine.connect()
@@ -34,6 +36,9 @@ class Bot(Task):
         self.retry = retry
         self.limit = limit
         self.error_limit = error_limit
+        self.workers = workers
+        self.background_writes = background_writes
+        self.shared_scan = shared_scan
         self.verbosity = verbosity
         self.download_delay = None
         self.requests = requests.Session()
@@ -52,7 +57,7 @@ class Bot(Task):
             self.define(pipe.pipe)
         return self
 
-    def define(self, name, uri_or_engine=None, compress=None):
+    def define(self, name, uri_or_engine=None, compress=None, bloom=False):
         """Defines new pipe for storing data.
 
         Parameters
@@ -61,15 +66,18 @@ class Bot(Task):
             Pipe name.
         uri_or_engine : str or sqlalchemy.Engine
             Database engine if this pipe used external database (other than defined in bot).
-        compression : databot.db.models.Compression, optional
-            Default compression for data values.
+        compress : databot.db.models.Compression or str or bool, optional
+            Default compression for data values: gzip, zstd or lz4. True means gzip.
+        bloom : bool, optional
+            Use a Bloom filter for ``append(only_missing=True)`` checks, uses less memory than exact set of keys, but
+            keys found in the filter are checked again in the database.
         """
         if name in self.pipes_by_name:
             raise ValueError('A pipe with "%s" name is already defined.' % name)
 
         if uri_or_engine is not None:
             samedb = False
-            engine = get_engine(uri_or_engine, self.path)
+            engine = get_engine(uri_or_engine, self.path, self.sqlite_pragmas)
             models = Models(sa.MetaData())
             migrations = Migrations(models, engine, self.output, verbosity=1)
             if migrations.has_initial_state():
@@ -109,7 +117,10 @@ class Bot(Task):
         table = models.get_data_table(table_name)
         table.create(engine, checkfirst=True)
 
-        pipe = databot.pipes.Pipe(self, table_id, name, table, engine, samedb, compress)
+        pipe = databot.pipes.Pipe(self, table_id, name, table, engine, samedb, compress, bloom)
+        if self.models.dictionaries.exists(self.engine):
+            # Dictionaries table does not exist until migrations are applied.
+            pipe.load_dictionaries()
         self.pipes.append(pipe)
         self.pipes_by_name[name] = pipe
         self.pipes_by_id[pipe.id] = pipe
@@ -142,9 +153,9 @@ class Bot(Task):
             error['target'] = strip_prefix(row, 'target_')
             yield error
 
-    def compact(self):
+    def compact(self, incremental=False):
         for pipe in self.pipes:
-            pipe.compact()
+            pipe.compact(incremental)
 
     def _register_commands(self, cmgr, pipeline=None):
         cmgr._register('status', commands.Status)
@@ -162,6 +173,7 @@ class Bot(Task):
         cmgr._register('export', commands.Export)
         cmgr._register('compress', commands.Compress)
         cmgr._register('decompress', commands.Decompress)
+        cmgr._register('train', commands.Train)
         cmgr._register('compact', commands.Compact)
         cmgr._register('download', commands.Download)
         cmgr._register('rename', commands.Rename)
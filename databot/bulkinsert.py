@@ -1,21 +1,76 @@
+import collections
+import contextlib
+import queue
+import threading
 import time
 
-from databot.utils.objsize import getsize
+import sqlalchemy as sa
+
+
+def rowsize(data):
+    """Estimate size of a row in bytes from lengths of its str and bytes values.
+
+    Rows are already serialized, so value blob usually takes most of the space and nested objects need not to be
+    walked.
+    """
+    return sum(len(v) for v in data.values() if isinstance(v, (bytes, str)))
+
+
+@contextlib.contextmanager
+def transaction(engine):
+    """Begin a transaction on an engine or on an already open connection and return the connection."""
+    if isinstance(engine, sa.engine.Connection):
+        with engine.begin():
+            yield engine
+    else:
+        with engine.begin() as conn:
+            yield conn
 
 
 class BulkInsert(object):
-    def __init__(self, engine, table, threshold=1000000, interval=5):
+    """Buffer rows and insert them to a table in bulk.
+
+    Each flush inserts all buffered rows, including rows appended to other tables, and calls post_save function in a
+    single transaction.
+
+    Parameters:
+    - engine: sqlalchemy.engine.base.Engine or sqlalchemy.engine.base.Connection
+    - table: sqlalchemy.Table
+    - threshold: int, flush buffer when estimated size of buffered rows in bytes exceeds threshold
+    - interval: int, flush buffer when it is older than interval in seconds
+    - maxrows: int, flush buffer when it has more than maxrows rows
+    - background: bool, insert rows in a background writer thread, so that caller can continue while rows are being
+      written, call close() to wait until all rows are written
+    - queuesize: int, in background mode, maximum number of flushed buffers waiting to be written, append blocks when
+      queue is full
+    """
+
+    def __init__(self, engine, table, threshold=1000000, interval=5, maxrows=1000, background=False, queuesize=2):
         self.size = 0
         self.time = None
         self.engine = engine
         self.table = table
         self._post_save = None
+        self._checkpoint = None
         self.threshold = threshold
         self.interval = interval  # interval in seconds
+        self.maxrows = maxrows
         self.buffer_ = []
+        self.background = background
+        self.queuesize = queuesize
+        self._queue = None
+        self._writer = None
+        self._error = None
+
+    def post_save(self, func, checkpoint=None):
+        """Register a function called after buffered rows are inserted, in the same transaction.
 
-    def post_save(self, func):
+        func is called with a connection as first argument. If checkpoint is given, it is called without arguments
+        when buffer is flushed, and its return value is passed to func after the flushed rows are written. This way
+        func gets state as it was at the time of flush, even if rows are written later in the background.
+        """
         self._post_save = func
+        self._checkpoint = checkpoint
 
     def timedelta(self):
         if self.time is None:
@@ -24,20 +79,86 @@ class BulkInsert(object):
         else:
             return time.time() - self.time
 
-    def append(self, data):
-        size = getsize(data)
-        if (self.size + size) > self.threshold or self.timedelta() > self.interval:
+    def append(self, data, table=None):
+        """Append a row to the buffer, rows can be appended to another table, than given to BulkInsert."""
+        self._add(self.table if table is None else table, data)
+
+    def execute(self, statement, params):
+        """Buffer a statement, for example an update, executed with other statements in bulk in the same flush.
+
+        Same statement object must be used for all parameters, that should be executed together.
+        """
+        self._add(statement, params)
+
+    def _add(self, statement, data):
+        size = rowsize(data)
+        if (
+            (self.size + size) > self.threshold or
+            len(self.buffer_) >= self.maxrows or
+            self.timedelta() > self.interval
+        ):
             self.save()
         self.size += size
-        self.buffer_.append(data)
+        self.buffer_.append((statement, data))
 
     def save(self, post_save=False):
-        if self.buffer_:
-            self.engine.execute(self.table.insert(), self.buffer_)
+        if self.buffer_ or (self._post_save and post_save):
+            buffer_ = self.buffer_
             self.size = 0
             self.time = None
             self.buffer_ = []
+            args = (self._checkpoint(),) if self._checkpoint else ()
+            if self.background:
+                self._put((buffer_, args))
+            else:
+                self._write(buffer_, args)
+
+    def flush(self):
+        """Write all buffered rows and wait until they are written, so that they can be queried."""
+        self.save()
+        self.close()
+
+    def close(self):
+        """Wait until all rows are written and stop background writer thread."""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        self._raise_error()
+
+    def _write(self, buffer_, args):
+        statements = collections.OrderedDict()
+        for statement, data in buffer_:
+            statements.setdefault(statement, []).append(data)
+        with transaction(self.engine) as conn:
+            for statement, params in statements.items():
+                if isinstance(statement, sa.Table):
+                    statement = statement.insert()
+                conn.execute(statement, params)
             if self._post_save:
-                self._post_save()
-        elif self._post_save and post_save:
-            self._post_save()
+                self._post_save(conn, *args)
+
+    def _put(self, item):
+        self._raise_error()
+        if self._writer is None:
+            self._queue = queue.Queue(self.queuesize)
+            self._writer = threading.Thread(target=self._run_writer, daemon=True)
+            self._writer.start()
+        self._queue.put(item)
+
+    def _run_writer(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is None:
+                # After an error, remaining buffers are dropped, so that post_save is never called for rows after
+                # the ones that were not written.
+                try:
+                    self._write(*item)
+                except Exception as e:
+                    self._error = e
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
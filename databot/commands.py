@@ -143,6 +143,16 @@ class Run(Command):
         parser.add_argument('-f', '--fail', type=int, default=None, const=0, nargs='?', action='store', help=(
             "Stop scraping after specified number of errors."
         ))
+        parser.add_argument('-w', '--workers', type=int, default=None, help=(
+            "Number of workers used to process rows of each task in parallel. Worker processes are used for call and "
+            "select tasks and threads for download tasks. By default, number of workers given to Bot is used."
+        ))
+        parser.add_argument('-b', '--background-writes', action='store_true', default=None, help=(
+            "Write rows to the database in a background thread, while next rows are being processed."
+        ))
+        parser.add_argument('-s', '--shared-scan', action='store_true', default=None, help=(
+            "Run consecutive select tasks having same source pipe in a single pass, parsing each source row once."
+        ))
 
     def run(self, args):
         source = self.bot.pipe(args.source) if args.source else None
@@ -150,11 +160,19 @@ class Run(Command):
         tasks = self.pipeline.get('tasks', []) if self.pipeline else []
         limits = [int(x) for x in map(str.strip, args.limit.split(',')) if x]
         self.call(tasks, source, target, debug=args.debug, retry=args.retry, limits=limits,
-                  error_limit=args.fail)
+                  error_limit=args.fail, workers=args.workers, background_writes=args.background_writes,
+                  shared_scan=args.shared_scan)
 
-    def call(self, tasks, source=None, target=None, *, debug=False, retry=False, limits=(1, 0), error_limit=None):
+    def call(self, tasks, source=None, target=None, *, debug=False, retry=False, limits=(1, 0), error_limit=None,
+             workers=None, background_writes=None, shared_scan=None):
         self.bot.debug = debug
         self.bot.retry = retry
+        if workers is not None:
+            self.bot.workers = workers
+        if background_writes is not None:
+            self.bot.background_writes = background_writes
+        if shared_scan is not None:
+            self.bot.shared_scan = shared_scan
 
         if self.bot.initializer:
             self.bot.initializer(self.bot)
@@ -414,12 +432,15 @@ class Compact(Command):
 
     def add_arguments(self, parser):
         parser.add_argument('pipe', type=str, nargs='?', help="Pipe id, for example: 1 or my-pipe")
+        parser.add_argument('-i', '--incremental', action='store_true', default=False, help=(
+            "Check only keys of rows appended after last compact."
+        ))
 
     def run(self, args):
         if args.pipe:
-            self.pipe(args.pipe).compact()
+            self.pipe(args.pipe).compact(args.incremental)
         else:
-            self.bot.compact()
+            self.bot.compact(args.incremental)
         self.bot.output.status(self.bot)
 
 
@@ -458,7 +479,7 @@ class Show(Command):
         key : str, optional
             Use specific key from pipe. If not specified last entry will be shown.
         errors : bool, optional
-            Read data frm target's errors.
+            Read data frm target's errors. If error was raised by a selector, full selector context is shown too.
         exclude : List[str], optional
             Exclude specified fields from output.
         prog : str, optional
@@ -467,10 +488,13 @@ class Show(Command):
         """
 
         import tempfile
+        import textwrap
         import subprocess
         import mimetypes
         import cgi
 
+        from databot.handlers import html
+
         if errors:
             assert target
             pipe = target(source).errors
@@ -480,7 +504,7 @@ class Show(Command):
             pipe = source
 
         row = pipe.last(key)
-        row = row['row'] if row and errors else row
+        error, row = (row, row['row']) if row and errors else (None, row)
 
         if row:
             if prog != '-' and 'content' in row.value and 'headers' in row.value:
@@ -508,6 +532,10 @@ class Show(Command):
             else:
                 exclude = exclude.split(',') if exclude else None
                 self.bot.output.key_value(row.key, row.value, exclude=exclude)
+
+            context = html.get_error_context(row, error['traceback']) if error else None
+            if context:
+                self.info('  context:\n\n%s' % textwrap.indent(context, '    '))
         else:
             if key:
                 self.info('Item with key=%r not found.' % key)
@@ -530,29 +558,38 @@ class Head(Command):
 
     def call(self, pipe, limit=10, table=False, include=None, exclude=None):
         from databot.db.utils import create_row
+        from databot.pipes import select_keys
 
-        rows = [create_row(row) for row in self.rows(pipe, limit)]
+        exclude = exclude.split(',') if exclude else None
+        include = include.split(',') if include else None
+
+        # Do not fetch values if only keys will be shown, values are still needed for rows without rawkey.
+        columns = pipe.table.c
+        if not table and exclude and 'value' in exclude:
+            columns = [c for c in columns if c.name != 'value'] + [
+                c for c in select_keys(pipe.table).inner_columns if c.name == 'value'
+            ]
+
+        rows = [create_row(row) for row in self.rows(pipe, columns, limit)]
 
         if rows:
-            exclude = exclude.split(',') if exclude else None
-            include = include.split(',') if include else None
             if table:
                 self.bot.output.table(rows, exclude=exclude, include=include)
             else:
                 for row in rows:
-                    self.bot.output.key_value(row.key, row.value, exclude=exclude)
+                    self.bot.output.key_value(row.key, row.get('value'), exclude=exclude)
         else:
             self.info('No items found.')
 
-    def rows(self, pipe, limit):
-        return pipe.engine.execute(pipe.table.select().order_by(pipe.table.c.id.asc()).limit(limit))
+    def rows(self, pipe, columns, limit):
+        return pipe.engine.execute(sa.select(columns).order_by(pipe.table.c.id.asc()).limit(limit))
 
 
 class Tail(Head):
     description = 'list newest items'
 
-    def rows(self, pipe, limit):
-        return reversed(list(pipe.engine.execute(pipe.table.select().order_by(pipe.table.c.id.desc()).limit(limit))))
+    def rows(self, pipe, columns, limit):
+        return reversed(list(pipe.engine.execute(sa.select(columns).order_by(pipe.table.c.id.desc()).limit(limit))))
 
 
 class Export(Command):
@@ -670,13 +707,19 @@ class Compress(Command):
     description = 'compress pipe to save free disk space'
 
     def add_arguments(self, parser):
+        from databot.db.models import Compression
+
         parser.add_argument('pipes', nargs='+', metavar='<pipe>', type=str, help="Pipe name or id")
+        parser.add_argument('-c', '--compression', choices=[c.name for c in Compression], help=(
+            "Compression algorithm, by default pipe compression or gzip is used."
+        ))
+        parser.add_argument('-w', '--workers', type=int, help="Number of worker processes used for compression.")
 
     def run(self, args):
         pipes = [self.pipe(x) for x in args.pipes]
-        self.call(*pipes)
+        self.call(*pipes, compression=args.compression, workers=args.workers)
 
-    def call(self, *pipes):
+    def call(self, *pipes, compression=None, workers=None):
         """Compress specified pipes.
 
         If you use SQLite, in order for compression to take effect, you need to vacuum SQLite database using this
@@ -686,14 +729,56 @@ class Compress(Command):
 
         This will require at least same amount of free space as path/to.db file is currently taking.
 
+        Rows are compressed in batches, each batch is committed separately, so if compression was interrupted, run this
+        command again and it will continue from the rows, that are not yet compressed.
+
         Parameters
         ----------
         *pipes : databot.pipes.Pipe
+        compression : databot.db.models.Compression or str, optional
+            Compression algorithm: gzip, zstd or lz4.
+        workers : int, optional
+            Number of worker processes used for compression.
 
         """
 
         for pipe in pipes:
-            pipe.compress()
+            pipe.compress(compression, workers=workers)
+
+
+class Train(Command):
+    description = 'train zstd compression dictionary for a pipe'
+
+    def add_arguments(self, parser):
+        from databot.pipes import DICTIONARY_SIZE
+
+        parser.add_argument('pipe', type=str, help="Pipe name or id")
+        parser.add_argument('-n', '--samples', type=int, default=1000, help="Number of sample rows.")
+        parser.add_argument('-s', '--size', type=int, default=DICTIONARY_SIZE, help="Maximum dictionary size in bytes.")
+
+    def run(self, args):
+        self.call(self.pipe(args.pipe), samples=args.samples, size=args.size)
+
+    def call(self, pipe, samples=1000, size=None):
+        """Train zstd compression dictionary from a sample of pipe rows.
+
+        Trained dictionary is used for new zstd compressed rows, to recompress existing rows run:
+
+            databot path/to.db compress <pipe> -c zstd
+
+        Parameters
+        ----------
+        pipe : databot.pipes.Pipe
+        samples : int
+            Number of sample rows.
+        size : int, optional
+            Maximum dictionary size in bytes.
+
+        """
+        from databot.pipes import DICTIONARY_SIZE
+
+        dictionary = pipe.train(samples, size or DICTIONARY_SIZE)
+        self.info('Trained dictionary %d for %s pipe.' % (dictionary, pipe))
 
 
 class Decompress(Command):
@@ -701,11 +786,12 @@ class Decompress(Command):
 
     def add_arguments(self, parser):
         parser.add_argument('pipes', nargs='+', metavar='<pipe>', type=str, help="Pipe name or id")
+        parser.add_argument('-w', '--workers', type=int, help="Number of worker processes used for decompression.")
 
     def run(self, args):
         pipes = [self.pipe(x) for x in args.pipes]
-        self.call(*pipes)
+        self.call(*pipes, workers=args.workers)
 
-    def call(self, *pipes):
+    def call(self, *pipes, workers=None):
         for pipe in pipes:
-            pipe.decompress()
+            pipe.decompress(workers=workers)
@@ -13,6 +13,8 @@ from alembic.operations import Operations
 
 from sqlalchemy.engine import reflection
 
+from databot.db.models import Compression
+from databot.db.serializers import dumps, loads_key
 from databot.db.windowedquery import windowed_query
 
 
@@ -129,6 +131,53 @@ class DataCompression(Migration):
         self.op.add_column(table.name, sa.Column('compression', sa.SmallInteger, nullable=True))
 
 
+class RawKey(Migration):
+
+    name = "raw key column"
+    data_tables = True
+
+    def migrate_data_table(self, table):
+        self.op.add_column(table.name, sa.Column('rawkey', sa.LargeBinary, nullable=True))
+        if 'rawkey' not in table.c:
+            table.append_column(sa.Column('rawkey', sa.LargeBinary, nullable=True))
+
+    def migrate_data_item(self, row):
+        compression = None if row['compression'] is None else Compression(row['compression'])
+        return dict(rawkey=dumps(loads_key(row['value'], compression)))
+
+
+class CompressionDictionaries(Migration):
+
+    name = "compression dictionaries table"
+
+    def migrate(self):
+        self.output.info('  creating compression dictionaries table...')
+        self.models.dictionaries.create(self.engine, checkfirst=True)
+
+
+class Indexes(Migration):
+
+    name = "errors and data table indexes"
+    data_tables = True
+
+    def migrate(self):
+        self.output.info('  creating errors table index...')
+        self.op.create_index('ix_databoterrors_state_id_row_id', 'databoterrors', ['state_id', 'row_id'])
+
+    def migrate_data_table(self, table):
+        self.op.create_index('ix_%s_created' % table.name, table.name, ['created'])
+        self.op.create_index('ix_%s_key_id' % table.name, table.name, ['key', 'id'])
+
+
+class MarksTable(Migration):
+
+    name = "marks table"
+
+    def migrate(self):
+        self.output.info('  creating marks table...')
+        self.models.marks.create(self.engine, checkfirst=True)
+
+
 class Migrations(object):
 
     migrations = {
@@ -139,6 +188,10 @@ class Migrations(object):
         TextToContent: {AlterKeyField},
         FixContentEncoding: {TextToContent},
         DataCompression: {FixContentEncoding},
+        RawKey: {DataCompression},
+        CompressionDictionaries: {RawKey},
+        Indexes: {CompressionDictionaries},
+        MarksTable: {Indexes},
     }
 
     def __init__(self, models, engine, output=sys.stdout, verbosity=1):
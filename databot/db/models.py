@@ -11,6 +11,8 @@ BigInteger = BigInteger.with_variant(sqlite.INTEGER(), 'sqlite')
 
 class Compression(enum.Enum):
     gzip = 1
+    zstd = 2  # requires zstandard package
+    lz4 = 3  # requires lz4 package
 
 
 class Models(object):
@@ -41,7 +43,8 @@ class Models(object):
             sa.Column('retries', sa.Integer, default=0),
             sa.Column('traceback', sa.UnicodeText, default='', nullable=False),
             sa.Column('created', sa.DateTime),
-            sa.Column('updated', sa.DateTime)
+            sa.Column('updated', sa.DateTime),
+            sa.Index('ix_databoterrors_state_id_row_id', 'state_id', 'row_id'),
         )
 
         self.migrations = sa.Table(
@@ -51,6 +54,26 @@ class Models(object):
             sa.Column('created', sa.DateTime),
         )
 
+        # Trained compression dictionaries, see Pipe.train.
+        self.dictionaries = sa.Table(
+            'databotdictionaries', metadata,
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('pipe_id', sa.Integer, sa.ForeignKey(self.pipes.c.id), nullable=False),
+            sa.Column('compression', sa.Integer, nullable=False),  # see Compression enum for possible values
+            sa.Column('data', sa.LargeBinary, nullable=False),
+            sa.Column('created', sa.DateTime),
+        )
+
+        # High-water marks of incremental pipe operations, see Pipe.compact.
+        self.marks = sa.Table(
+            'databotmarks', metadata,
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('pipe_id', sa.Integer, sa.ForeignKey(self.pipes.c.id), nullable=False),
+            sa.Column('name', sa.String(255), nullable=False),
+            sa.Column('value', BigInteger, nullable=False),
+            sa.UniqueConstraint('pipe_id', 'name'),
+        )
+
     def get_data_table(self, name):
         return sa.Table(
             name, self.metadata,
@@ -59,4 +82,7 @@ class Models(object):
             sa.Column('value', sa.LargeBinary, default='', nullable=False),
             sa.Column('created', sa.DateTime, default=datetime.datetime.utcnow),
             sa.Column('compression', sa.Integer, nullable=True),  # see Compression enum for possible values
+            sa.Column('rawkey', sa.LargeBinary, nullable=True),  # msgpack serialized key, see serializers.serrow
+            sa.Index('ix_%s_created' % name, 'created'),
+            sa.Index('ix_%s_key_id' % name, 'key', 'id'),
         )
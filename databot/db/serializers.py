@@ -1,17 +1,168 @@
+import io
 import gzip
+import zlib
 import msgpack
 import hashlib
+import functools
 
 from databot.db.models import Compression
 
+# Registered zstd dictionaries, dictionary id -> zstandard.ZstdCompressionDict.
+#
+# Dictionary id is stored in each zstd frame header, so values compressed with a dictionary are decompressed using
+# the right dictionary without storing dictionary id separately.
+DICTIONARIES = {}
+
+
+def register_dictionary(data):
+    """Register a trained zstd dictionary and return its id.
+
+    Parameters:
+    - data: bytes, dictionary data, as returned by ``zstandard.ZstdCompressionDict.as_bytes``
+
+    Returns: int
+    """
+    import zstandard
+    dictionary = zstandard.ZstdCompressionDict(data)
+    DICTIONARIES[dictionary.dict_id()] = dictionary
+    return dictionary.dict_id()
+
+
+def train_dictionary(samples, size):
+    """Train zstd dictionary from a list of sample values and return dictionary data as bytes."""
+    import zstandard
+    return zstandard.train_dictionary(size, samples).as_bytes()
+
+
+def get_dictionary_id(value):
+    """Return dictionary id of a zstd compressed value or None if value was compressed without a dictionary."""
+    import zstandard
+    return zstandard.get_frame_parameters(value).dict_id or None
+
+
+@functools.lru_cache()
+def zstd_compressor(dictionary=None):
+    import zstandard
+    if dictionary is None:
+        return zstandard.ZstdCompressor(level=3)
+    else:
+        return zstandard.ZstdCompressor(level=3, dict_data=DICTIONARIES[dictionary])
+
+
+@functools.lru_cache()
+def zstd_decompressor(dictionary=None):
+    import zstandard
+    if dictionary is None:
+        return zstandard.ZstdDecompressor()
+    elif dictionary in DICTIONARIES:
+        return zstandard.ZstdDecompressor(dict_data=DICTIONARIES[dictionary])
+    else:
+        raise ValueError("Unknown zstd compression dictionary %d." % dictionary)
+
+
+def compress(value, compression, dictionary=None):
+    """Compress bytes using given compression algorithm.
+
+    zstd and lz4 require optional zstandard and lz4 packages. dictionary is an id of a registered zstd dictionary, it is
+    ignored by other compression algorithms.
+    """
+    if compression == Compression.gzip:
+        # See: https://quixdb.github.io/squash-benchmark/#results
+        return gzip.compress(value, compresslevel=1)
+    elif compression == Compression.zstd:
+        return zstd_compressor(dictionary).compress(value)
+    elif compression == Compression.lz4:
+        import lz4.frame
+        return lz4.frame.compress(value)
+    else:
+        return value
+
+
+def decompress(value, compression):
+    """Decompress bytes compressed with given compression algorithm."""
+    if compression == Compression.gzip:
+        return gzip.decompress(value)
+    elif compression == Compression.zstd:
+        return zstd_decompressor(get_dictionary_id(value)).decompress(value)
+    elif compression == Compression.lz4:
+        import lz4.frame
+        return lz4.frame.decompress(value)
+    else:
+        return value
+
+
+def recompress(value, source, target, dictionary=None):
+    """Recompress a value blob compressed with source compression using target compression.
+
+    Blob is not deserialized, so this is a lot cheaper than loads followed by servalue.
+    """
+    return compress(decompress(value, source), target, dictionary)
+
+
+def get_dictionaries():
+    """Return data of all registered dictionaries, for registering them again in another process."""
+    return {k: v.as_bytes() for k, v in DICTIONARIES.items()}
+
+
+def open_decompressed(value, compression):
+    """Return a file-like object for reading decompressed value incrementally."""
+    stream = io.BytesIO(value)
+    if compression == Compression.gzip:
+        return gzip.GzipFile(fileobj=stream)
+    elif compression == Compression.zstd:
+        return zstd_decompressor(get_dictionary_id(value)).stream_reader(stream)
+    elif compression == Compression.lz4:
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(stream)
+    else:
+        return stream
+
 
 def loads(value, compression=None):
     """Convert Python object to a primitive value for storing to database."""
     if value is None:
         return None
+    return msgpack.loads(decompress(value, compression), encoding='utf-8')
+
+
+def iter_decompressed(value, compression=None, chunksize=1024):
+    """Decompress value incrementally, yielding chunks of at most chunksize bytes."""
     if compression == Compression.gzip:
-        value = gzip.decompress(value)
-    return msgpack.loads(value, encoding='utf-8')
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        while value:
+            yield decompressor.decompress(value, chunksize)
+            value = decompressor.unconsumed_tail
+    elif compression is None:
+        for i in range(0, len(value), chunksize):
+            yield value[i:i + chunksize]
+    else:
+        reader = open_decompressed(value, compression)
+        chunk = reader.read(chunksize)
+        while chunk:
+            yield chunk
+            chunk = reader.read(chunksize)
+
+
+def loads_key(value, compression=None):
+    """Deserialize only key from a value blob created by servalue.
+
+    Value blob is decompressed and unpacked only until the key is read, so the value itself, which can be large, is not
+    decoded.
+    """
+    if value is None:
+        return None
+    unpacker = msgpack.Unpacker(encoding='utf-8')
+    header = False
+    for chunk in iter_decompressed(value, compression):
+        unpacker.feed(chunk)
+        try:
+            if not header:
+                unpacker.read_array_header()
+                header = True
+            return unpacker.unpack()
+        except msgpack.OutOfData:
+            pass
+    raise ValueError("Value blob does not contain a key.")
 
 
 def dumps(value):
@@ -25,16 +176,12 @@ def serkey(key):
     return hashlib.sha1(dumps(key)).hexdigest()
 
 
-def servalue(key, value, compression=None):
+def servalue(key, value, compression=None, dictionary=None):
     """Serialize key and value to a single value blob optionally applying compression."""
-    value = dumps([key, value])
-    if compression == Compression.gzip:
-        # See: https://quixdb.github.io/squash-benchmark/#results
-        value = gzip.compress(value, compresslevel=1)
-    return value
+    return compress(dumps([key, value]), compression, dictionary)
 
 
-def serrow(key, value, compression=None, **kwargs):
-    value = servalue(key, value, compression)
+def serrow(key, value, compression=None, dictionary=None, **kwargs):
+    value = servalue(key, value, compression, dictionary)
     compression = None if compression is None else int(compression.value)
-    return dict(kwargs, key=serkey(key), value=value, compression=compression)
+    return dict(kwargs, key=serkey(key), value=value, compression=compression, rawkey=dumps(key))
@@ -1,21 +1,102 @@
+import collections
 import pathlib
 import sqlalchemy as sa
 import sqlalchemy.orm.exc
 
 from databot.db.models import Compression
-from databot.db.serializers import loads
+from databot.db.serializers import loads, loads_key
 
 
 class Row(dict):
+    """A dict with items accessible as attributes.
+
+    Rows created from data tables with create_row are lazy, key and value are decoded from the value blob on first
+    access. Key is taken from the rawkey column, or if it is not available, only key is decoded from the value blob.
+    Checking if a name is in a row does not decode anything, all other access to row as a dict decodes both key and
+    value.
+    """
+
+    __slots__ = ('__dict__', '_blob')
+
     def __init__(self, *args, **kwargs):
+        for arg in args:
+            if isinstance(arg, Row):
+                arg._decode()
         super().__init__(*args, **kwargs)
         self.__dict__ = self
+        self._blob = None
+
+    @classmethod
+    def lazy(cls, row, compression):
+        self = cls(row, compression=compression)
+        self._blob = self.pop('value', None)
+        self.pop('key', None)
+        rawkey = self.pop('rawkey', None)
+        if rawkey is not None:
+            self['key'] = loads(rawkey)
+        return self
+
+    def __getattr__(self, name):
+        if name in ('key', 'value') and self._blob is not None:
+            return self[name]
+        raise AttributeError(name)
+
+    def __missing__(self, name):
+        if name == 'key' and self._blob is not None:
+            self['key'] = loads_key(self._blob, self['compression'])
+            return self['key']
+        elif name == 'value' and self._blob is not None:
+            return self._decode()['value']
+        raise KeyError(name)
+
+    def _decode(self):
+        if self._blob is not None:
+            key, value = loads(self._blob, self['compression'])
+            self._blob = None
+            self['key'] = key
+            self['value'] = value
+        return self
+
+    def __contains__(self, name):
+        if name in ('key', 'value') and self._blob is not None:
+            # Both key and value are in the blob, it does not have to be decoded.
+            return True
+        return super().__contains__(name)
+
+    def __iter__(self):
+        return super(Row, self._decode()).__iter__()
+
+    def __len__(self):
+        return super(Row, self._decode()).__len__()
+
+    def __eq__(self, other):
+        return super(Row, self._decode()).__eq__(other)
+
+    def __ne__(self, other):
+        return super(Row, self._decode()).__ne__(other)
+
+    def __reduce__(self):
+        return Row, (dict(self._decode()),)
+
+    def get(self, name, default=None):
+        return super(Row, self._decode()).get(name, default)
+
+    def keys(self):
+        return super(Row, self._decode()).keys()
+
+    def values(self):
+        return super(Row, self._decode()).values()
+
+    def items(self):
+        return super(Row, self._decode()).items()
+
+    def copy(self):
+        return Row(self)
 
 
 def create_row(row):
     compression = None if row['compression'] is None else Compression(row['compression'])
-    key, value = loads(row['value'], compression)
-    return Row(row, key=key, value=value, compression=compression)
+    return Row.lazy(row, compression)
 
 
 def strip_prefix(row, prefix):
@@ -78,14 +159,73 @@ def get_or_create(engine, model, fields, data):
         return get_or_none(engine, model, *params)
 
 
-def get_engine(uri_or_engine, path=''):
+def is_memory_db(engine):
+    """Check if engine is an in-memory SQLite database, which is not shared between threads."""
+    return engine.dialect.name == 'sqlite' and engine.url.database in (None, '', ':memory:')
+
+
+# Opt-in SQLite performance profile.
+#
+# WAL journal lets readers work while data is being written and with synchronous=NORMAL only checkpoints are synced
+# to disk, so each commit costs no fsync. Last transactions can be lost on power failure, but database stays
+# consistent. Negative cache_size is in KiB.
+SQLITE_PERFORMANCE_PRAGMAS = collections.OrderedDict([
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -64000),
+    ('mmap_size', 268435456),
+    ('temp_store', 'MEMORY'),
+])
+
+
+def get_sqlite_pragmas(pragmas):
+    """Get SQLite pragmas dict from True (performance profile), a dict or None."""
+    if pragmas is True:
+        return SQLITE_PERFORMANCE_PRAGMAS
+    else:
+        return pragmas or None
+
+
+def set_sqlite_pragmas(engine, pragmas):
+    """Execute given pragmas on each new connection of a SQLite engine, other engines are left as is.
+
+    Parameters:
+    - engine: sqlalchemy.engine.base.Engine
+    - pragmas: dict, pragma names and values, True means SQLITE_PERFORMANCE_PRAGMAS
+
+    Returns: engine
+    """
+    pragmas = get_sqlite_pragmas(pragmas)
+    if pragmas and engine.dialect.name == 'sqlite':
+        def connect(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute('PRAGMA %s = %s' % (name, value))
+            cursor.close()
+
+        sa.event.listen(engine, 'connect', connect)
+    return engine
+
+
+def get_engine(uri_or_engine, path='', sqlite_pragmas=None):
+    """Create an engine from a database URI or a path to SQLite database file.
+
+    If sqlite_pragmas are given, SQLite connections are kept open in a pool, so that pragmas, page cache and memory
+    mapping are not lost after each query. Each checkout gets its own connection, so a query on the engine does not
+    end a transaction, that is open on another connection in the same thread.
+    """
     if isinstance(uri_or_engine, str):
         spl = uri_or_engine.split(':', 1)
         spl = spl[0].split('+', 1) if len(spl) > 1 and '+' in spl[0] else spl
         if len(spl) > 1 and spl[0] in ('sqlite', 'postgresql', 'mysql'):
-            return sa.create_engine(uri_or_engine.format(path=path))
+            uri = uri_or_engine.format(path=path)
+        else:
+            uri = 'sqlite:///%s' % pathlib.Path(uri_or_engine)
+        if sqlite_pragmas and uri.startswith('sqlite'):
+            # Pooled connections can be checked out by another thread, for example by a background writer.
+            engine = sa.create_engine(uri, poolclass=sa.pool.QueuePool, connect_args={'check_same_thread': False})
+            return set_sqlite_pragmas(engine, sqlite_pragmas)
         else:
-            filename = pathlib.Path(uri_or_engine)
-            return sa.create_engine('sqlite:///%s' % filename)
+            return sa.create_engine(uri)
     else:
         return uri_or_engine
@@ -1,35 +1,79 @@
-import funcy
-import sqlalchemy as sa
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import UnaryExpression
 
-from sqlalchemy.engine.base import Engine
+# Default number of rows fetched with a single query.
+WINDOWSIZE = 1000
 
 
-def column_windows(engine, column, windowsize):
-    # Based on: https://bitbucket.org/zzzeek/sqlalchemy/wiki/UsageRecipes/WindowedRangeQuery
-    rows = sa.select([column, sa.func.row_number().over(order_by=column).label('rownum')]).alias()
-    whereclause = sa.text('rownum %% %d = 1' % windowsize) if windowsize > 1 else None
-    query = sa.select([rows.c[column.name]], whereclause).select_from(rows).order_by(rows.c.rownum)
-    intervals = [id for id, in engine.execute(query)]
+def unwrap_order_by(column):
+    """Return column and True if column ordering is descending."""
+    if isinstance(column, UnaryExpression) and column.modifier is operators.desc_op:
+        return column.element, True
+    else:
+        return column, False
+
+
+def windowed_query(engine, query, column, windowsize=WINDOWSIZE):
+    """Break a query into windows on a given column.
+
+    Uses keyset pagination: each window is fetched with ``WHERE column > last ORDER BY column LIMIT windowsize``, where
+    last is the column value of the last row from previous window, so each window costs the same regardless how deep
+    into the query it is.
+
+    Parameters:
+    - engine: sqlalchemy.engine.base.Engine or sqlalchemy.engine.base.Connection
+    - query: sqlalchemy.sql.expression.Select, previous ordering of the query is replaced by column
+    - column: sqlalchemy.Column, must be unique, use ``column.desc()`` for descending order
+    - windowsize: int, number of rows fetched with a single query
+
+    Returns: generator
+    """
+    column, desc = unwrap_order_by(column)
+    query = query.order_by(None).order_by(column.desc() if desc else column).limit(windowsize)
+    window = query
+    while True:
+        rows = list(engine.execute(window))
+        yield from rows
+        if len(rows) < windowsize:
+            break
+        last = rows[-1][column]
+        window = query.where(column < last if desc else column > last)
+
+
+def streamed_query(engine, query, column, fetchsize=WINDOWSIZE):
+    """Execute a query using a server side cursor and fetch rows in batches of fetchsize.
 
-    end_id = intervals[0] if intervals else None
-    for start_id, end_id in funcy.pairwise(intervals):
-        yield sa.and_(sa.and_(column >= start_id, column < end_id))
+    Unlike windowed_query, whole query is executed only once and memory usage does not depend on number of rows. Server
+    side cursors are used only if database driver supports them, for example PostgreSQL (named cursors) or MySQL.
 
-    if end_id is not None:
-        yield column >= end_id
+    Parameters:
+    - engine: sqlalchemy.engine.base.Engine or sqlalchemy.engine.base.Connection
+    - query: sqlalchemy.sql.expression.Select, previous ordering of the query is replaced by column
+    - column: sqlalchemy.Column, use ``column.desc()`` for descending order
+    - fetchsize: int, number of rows fetched from cursor at once
 
+    Returns: generator
+    """
+    query = query.order_by(None).order_by(column)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True).execute(query)
+        try:
+            rows = result.fetchmany(fetchsize)
+            while rows:
+                yield from rows
+                rows = result.fetchmany(fetchsize)
+        finally:
+            result.close()
 
-def offset_windows(engine, query, column, windowsize):
-    total = engine.execute(query.alias().count()).scalar()
-    yield from range(0, total, windowsize)
 
+def iter_query(engine, query, column, windowsize=WINDOWSIZE):
+    """Iterate over query rows ordered by column.
 
-def windowed_query(engine, query, column, windowsize=1000):
-    """"Break a query into windows on a given column."""
-    name = engine.name if isinstance(engine, Engine) else engine.engine.name
-    if name == 'postgresql':
-        for whereclause in column_windows(engine, column, windowsize):
-            yield from list(engine.execute(query.where(whereclause).order_by(column)))
+    If database supports server side cursors, rows are streamed using a single query, otherwise query is split into
+    windows. SQLite cursors are already lazy, but an open cursor would hold a lock for the whole iteration, so windows
+    are used there.
+    """
+    if engine.dialect.supports_server_side_cursors:
+        return streamed_query(engine, query, column, windowsize)
     else:
-        for offset in offset_windows(engine, query, column, windowsize):
-            yield from list(engine.execute(query.order_by(column).offset(offset).limit(windowsize)))
+        return windowed_query(engine, query, column, windowsize)
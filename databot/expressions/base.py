@@ -127,6 +127,15 @@ class Expression:
         else:
             return item.args, item.kwargs
 
+    def _eval_head(self, value, n):
+        """Evaluate only first n items of expression.
+
+        Returns evaluated value and a tuple of remaining items, that were not evaluated. This is counted as an
+        evaluation of whole expression.
+        """
+        self._evals += 1
+        return Expression(self._stack[:n])._eval(value), self._stack[n:]
+
     def _eval(self, value, base=None):
         """Evaluate expression with given value and base.
 
@@ -1,4 +1,7 @@
 import time
+import threading
+import contextlib
+import urllib.parse
 
 from databot import recursive
 from databot.db.utils import Row
@@ -41,15 +44,46 @@ def check_download(url, response, check):
     select.check_render(row, select.html, check, many=True)
 
 
-def download(session, urlexpr, delay=None, update=None, check=None, method='GET', **kwargs):
+class HostThrottle(object):
+    """Limit number of concurrent requests and delay between requests to the same host.
+
+    Can be shared between multiple threads, each host gets its own semaphore and its own request schedule.
+    """
+
+    def __init__(self, workers=1, delay=None):
+        self.workers = workers
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        self.schedule = {}
+
+    @contextlib.contextmanager
+    def __call__(self, url):
+        host = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.workers)
+        with self.semaphores[host]:
+            if self.delay:
+                with self.lock:
+                    now = time.monotonic()
+                    start = max(now, self.schedule.get(host, now))
+                    self.schedule[host] = start + self.delay
+                time.sleep(start - now)
+            yield
+
+
+def download(session, urlexpr, delay=None, update=None, check=None, method='GET', throttle=None, **kwargs):
+    """Create a handler that downloads a url taken from a row.
+
+    If throttle is given, delay is ignored and requests are delayed and limited per host by throttle instead, see
+    HostThrottle.
+    """
     update = update or {}
 
     def func(row):
         nonlocal kwargs
 
-        if delay is not None:
-            time.sleep(delay)
-
         if isinstance(row, Row):
             _kwargs = recursive.call(kwargs, row)
             url = urlexpr._eval(row) if isinstance(urlexpr, Expression) else urlexpr
@@ -57,7 +91,13 @@ def download(session, urlexpr, delay=None, update=None, check=None, method='GET'
             _kwargs = kwargs
             url = row
 
-        response = session.request(method, url, **_kwargs)
+        if throttle is not None:
+            with throttle(url):
+                response = session.request(method, url, **_kwargs)
+        else:
+            if delay is not None:
+                time.sleep(delay)
+            response = session.request(method, url, **_kwargs)
 
         if response.status_code == 200:
             value = dump_response(response, url, dict(method=method, **_kwargs))
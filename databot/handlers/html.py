@@ -1,7 +1,12 @@
 import re
 import lxml.html
 import lxml.etree
+import lxml.cssselect
+import functools
 import itertools
+import collections
+
+from xml.sax.saxutils import escape, quoteattr
 
 from cssselect.parser import SelectorSyntaxError
 from cssselect.xpath import ExpressionError
@@ -30,6 +35,20 @@ def create_bs4_parser(row):
     return BeautifulSoup(content, 'lxml')
 
 
+class SharedParser:
+    """Parse HTML of a row once and return same tree while called with the same row, see databot.pipes.shared_scan."""
+
+    def __init__(self):
+        self.row = None
+        self.html = None
+
+    def __call__(self, row):
+        if row is not self.row:
+            self.html = create_html_parser(row)
+            self.row = row
+        return self.html
+
+
 class Select(object):
 
     def __init__(self, key, value=None, check=True):
@@ -46,23 +65,43 @@ class Select(object):
         self.key = key
         self.value = value
         self.check = check
+        self.parser = create_html_parser
+        self.only_key = isinstance(key, (list, Call, Expression)) and value is None
+        self.key_plan = self.compile(key)
+        self.value_plan = self.compile(value)
+
+    def __getstate__(self):
+        # Compiled plans are closures and can't be pickled, they are compiled again when Select is sent to a worker
+        # process.
+        state = dict(self.__dict__)
+        state.pop('key_plan', None)
+        state.pop('value_plan', None)
+        state.pop('html', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.key_plan = self.compile(self.key)
+        self.value_plan = self.compile(self.value)
 
     def __call__(self, row):
         self.set_row(row)
 
-        if isinstance(self.key, (list, Call, Expression)) and self.value is None:
-            return self.check_render(row, self.html, self.key)
+        if self.only_key:
+            return self.check_result(row, self.html, self.key_plan(row, self.html))
         else:
-            return [(self.render(row, self.html, self.key), self.check_render(row, self.html, self.value))]
+            return [(self.key_plan(row, self.html), self.check_result(row, self.html, self.value_plan(row, self.html)))]
 
     def set_row(self, row):
         if isinstance(row.value, dict) and 'content' in row.value:
-            self.html = create_html_parser(row)
+            self.html = self.parser(row)
         else:
             self.html = None
 
     def check_render(self, row, html, value, **kwargs):
-        result = self.render(row, html, value, **kwargs)
+        return self.check_result(row, html, self.render(row, html, value, **kwargs))
+
+    def check_result(self, row, html, result):
         if result:
             return result
         elif isinstance(result, list):
@@ -143,15 +182,7 @@ class Select(object):
                 else:
                     value = html
 
-                try:
-                    if many and single:
-                        return [expr._eval(v, row) for v in value]
-                    else:
-                        return expr._eval(value, row)
-                except Exception as e:
-                    raise SelectorError("Expression error while evaluating %r. Error: %s. Context:\n\n%s" % (
-                        value, e, lxml.etree.tostring(html, pretty_print=True).decode('utf-8')
-                    ))
+                return self.eval_expression(row, html, expr, value, many, single)
             else:
                 return value._eval(row)
         elif isinstance(value, Call):
@@ -170,106 +201,213 @@ class Select(object):
         elif isinstance(value, tuple):
             return tuple([self.render(row, html, v, many, single) for v in value])
         else:
-            result = self.select(html, value)
+            return self.render_query(row, html, value, many)
 
-            if not isinstance(result, list):
-                return result
+    def eval_expression(self, row, html, expr, value, many, single):
+        try:
+            if many and single:
+                return [expr._eval(v, row) for v in value]
+            else:
+                return expr._eval(value, row)
+        except Exception as e:
+            raise SelectorError("Expression error while evaluating %r. Error: %s." % (value, e), html)
 
-            if many:
-                return result
-            elif len(result) == 0:
-                if value.endswith('?'):
-                    return None
-                else:
-                    if html.tag != 'html':
-                        raise SelectorError("'%s' did not returned any results. Context:\n\n%s" % (
-                            value, lxml.etree.tostring(html, pretty_print=True).decode('utf-8')
-                        ))
-                    else:
-                        raise SelectorError("'%s' did not returned any results. Source: %s" % (value, row.key))
-            elif len(result) > 1:
+    def render_query(self, row, html, query, many):
+        result = self.select(html, query)
+
+        if not isinstance(result, list):
+            return result
+
+        if many:
+            return result
+        elif len(result) == 0:
+            if query.endswith('?'):
+                return None
+            else:
                 if html.tag != 'html':
-                    raise SelectorError("'%s' returned more than one value: %r. Context:\n\n%s" % (
-                        value, result, lxml.etree.tostring(html, pretty_print=True).decode('utf-8')
-                    ))
+                    raise SelectorError("'%s' did not returned any results." % query, html)
                 else:
-                    raise SelectorError("'%s' returned more than one value: %r." % (value, result))
+                    raise SelectorError("'%s' did not returned any results. Source: %s" % (query, row.key))
+        elif len(result) > 1:
+            if html.tag != 'html':
+                raise SelectorError("'%s' returned more than one value: %r." % (query, result), html)
+            else:
+                raise SelectorError("'%s' returned more than one value: %r." % (query, result))
+        else:
+            return result[0]
+
+    def compile(self, value):
+        """Compile a query to a plan, a function taking (row, html, many=False, single=True) arguments.
+
+        Plan returns same result as ``render(row, html, value, many, single)``, but type of each query node is checked
+        only once, when plan is compiled, so rendering a row is a walk over prebound functions.
+        """
+        if value is None:
+            def plan(row, html, many=False, single=True):
+                return None
+        elif isinstance(value, Expression):
+            item = value._stack[0] if value._stack and isinstance(value._stack[0], Func) else None
+            name = item.name if item else None
+            if name == 'select':
+                expr = Expression(value._stack[1:])
+                query = self.compile(item.args[0]) if item.args else None
+
+                def plan(row, html, many=False, single=True):
+                    if query:
+                        kwargs = dict(many=many, single=single)
+                        kwargs.update(item.kwargs)
+                        value = query(row, html, *item.args[1:], **kwargs)
+                    else:
+                        value = html
+                    return self.eval_expression(row, html, expr, value, many, single)
+            else:
+                def plan(row, html, many=False, single=True):
+                    return value._eval(row)
+        elif isinstance(value, Call):
+            if issubclass(get_owner(type(value), 'compile'), get_owner(type(value), '__call__')):
+                plan = value.compile(self)
             else:
-                return result[0]
+                # Call subclass with its own __call__, it renders queries itself.
+                def plan(row, html, many=False, single=True):
+                    return value(self, row, html, many, single)
+        elif callable(value):
+            def plan(row, html, many=False, single=True):
+                return value(row, html)
+        elif isinstance(value, dict):
+            items = [(k, self.compile(v)) for k, v in sorted(value.items())]
+
+            def plan(row, html, many=False, single=True):
+                return {k: v(row, html, many, single) for k, v in items}
+        elif isinstance(value, list):
+            if len(value) == 2:
+                query, value = map(self.compile, value)
+
+                def plan(row, html, many=False, single=True):
+                    return [value(row, node) for node in query(row, html, True, False)]
+            else:
+                query = self.compile(value[0])
+
+                def plan(row, html, many=False, single=True):
+                    return query(row, html, True, True)
+        elif isinstance(value, tuple):
+            items = [self.compile(v) for v in value]
+
+            def plan(row, html, many=False, single=True):
+                return tuple([v(row, html, many, single) for v in items])
+        else:
+            def plan(row, html, many=False, single=True):
+                return self.render_query(row, html, value, many)
+        return plan
 
     def select(self, html, query):
-        engines = {'xpath': self.xpath, 'css': self.cssselect}
-        split_re = re.compile(r'\b(%s):' % '|'.join(engines.keys()))
-        queries = filter(None, [s.strip() for s in split_re.split(query)])
-        engine = self.cssselect
         result = [html]
-        for subquery in queries:
-            if subquery in engines:
-                engine = engines[subquery]
-            else:
-                result = [engine(node, subquery) for node in result]
-                result = [x if isinstance(x, list) else [x] for x in result]
-                result = itertools.chain.from_iterable(result)
+        for engine, subquery in parse_query(query):
+            method = getattr(self, ENGINES[engine])
+            result = [method(node, subquery) for node in result]
+            result = [x if isinstance(x, list) else [x] for x in result]
+            result = itertools.chain.from_iterable(result)
         return list(result)
 
     def xpath(self, html, query):
-        query = query.rstrip('?')
         try:
-            return html.xpath(query)
-        except lxml.etree.XPathEvalError as e:
-            raise ValueError('Invalid selector "%s", %s' % (query, e))
+            return compile_xpath(query)(html)
+        except lxml.etree.XPathError as e:
+            raise ValueError('Invalid selector "%s", %s' % (query.rstrip('?'), e))
 
     def cssselect(self, html, query):
-        attr = None
-        text = False
-        content = False
-        tail = False
-
-        nth_child_re = re.compile(r'\[(\d+)\]')
-        query = nth_child_re.sub(r':nth-child(\1)', query)
-
-        query = query.rstrip('?')
-
-        attr_re = re.compile(r'@([a-zA-Z0-9-_]+)$')
-        match = attr_re.search(query)
-        if match:
-            attr = match.group(1)
-            query = attr_re.sub('', query)
-        elif query.endswith(':content'):
-            content = True
-            query = query[:-8]
-        elif query.endswith(':text'):
-            text = True
-            query = query[:-5]
-        elif query.endswith(':tail'):
-            tail = True
-            query = query[:-5]
-
-        if query.startswith('/'):
-            query = query[1:]
+        query = compile_css(query)
+
+        if query.root:
             html = self.html
 
-        if query:
-            try:
-                elements = html.cssselect(query)
-            except (SelectorSyntaxError, ExpressionError) as e:
-                raise ValueError('Invalid selector "%s", %s' % (query, e))
+        if query.selector is not None:
+            elements = query.selector(html)
         else:
             elements = [html]
 
-        result = []
-        for elem in elements:
-            if attr:
-                result.append(elem.get(attr))
-            elif content:
-                result.append(elem.text_content())
-            elif text:
-                result.append(elem.text)
-            elif tail:
-                result.append(elem.tail)
-            else:
-                result.append(elem)
-        return result
+        if query.attr:
+            return [elem.get(query.attr) for elem in elements]
+        elif query.content:
+            return [elem.text_content() for elem in elements]
+        elif query.text:
+            return [elem.text for elem in elements]
+        elif query.tail:
+            return [elem.tail for elem in elements]
+        else:
+            return elements
+
+
+# Compiled queries are cached at module level, because same few selectors are used for all rows of all Select
+# instances, and translating CSS to XPath costs a lot more than evaluating the XPath on a page.
+ENGINES = {'xpath': 'xpath', 'css': 'cssselect'}
+SPLIT_RE = re.compile(r'\b(%s):' % '|'.join(ENGINES))
+NTH_CHILD_RE = re.compile(r'\[(\d+)\]')
+ATTR_RE = re.compile(r'@([a-zA-Z0-9-_]+)$')
+
+# Maximum number of characters of context markup included in SelectorError messages.
+CONTEXT_SIZE = 1000
+CONTEXT_PATH_RE = re.compile(r' Context: (/\S*)')
+
+CssQuery = collections.namedtuple('CssQuery', 'selector root attr text content tail')
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_query(query):
+    """Split query into a tuple of (engine, subquery) pairs, where engine is 'css' or 'xpath'."""
+    engine = 'css'
+    result = []
+    for subquery in filter(None, [s.strip() for s in SPLIT_RE.split(query)]):
+        if subquery in ENGINES:
+            engine = subquery
+        else:
+            result.append((engine, subquery))
+    return tuple(result)
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_xpath(query):
+    return lxml.etree.XPath(query.rstrip('?'))
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_css(query):
+    """Translate CSS query with databot extensions to a CssQuery with compiled lxml.etree.XPath selector."""
+    attr = None
+    text = False
+    content = False
+    tail = False
+
+    query = NTH_CHILD_RE.sub(r':nth-child(\1)', query)
+
+    query = query.rstrip('?')
+
+    match = ATTR_RE.search(query)
+    if match:
+        attr = match.group(1)
+        query = ATTR_RE.sub('', query)
+    elif query.endswith(':content'):
+        content = True
+        query = query[:-8]
+    elif query.endswith(':text'):
+        text = True
+        query = query[:-5]
+    elif query.endswith(':tail'):
+        tail = True
+        query = query[:-5]
+
+    root = query.startswith('/')
+    if root:
+        query = query[1:]
+
+    if query:
+        try:
+            selector = lxml.cssselect.CSSSelector(query, translator='html')
+        except (SelectorSyntaxError, ExpressionError) as e:
+            raise ValueError('Invalid selector "%s", %s' % (query, e))
+    else:
+        selector = None
+
+    return CssQuery(selector, root, attr, text, content, tail)
 
 
 class Call:
@@ -289,6 +427,20 @@ class Call:
                 value = call(value, *self.args, **self.kwargs)
         return value
 
+    def compile(self, select):
+        """Compile this call to a plan, see Select.compile."""
+        query = select.compile(self.query)
+
+        def plan(row, node, many=False, single=True):
+            value = query(row, node, many, single)
+            for call in self.callables:
+                if many and single:
+                    value = [call(v, *self.args, **self.kwargs) for v in value]
+                else:
+                    value = call(value, *self.args, **self.kwargs)
+            return value
+        return plan
+
 
 class Join(Call):
 
@@ -301,6 +453,16 @@ class Join(Call):
             result.extend(select.render(row, node, query, many, single))
         return result
 
+    def compile(self, select):
+        queries = [select.compile(query) for query in self.queries]
+
+        def plan(row, node, many=False, single=True):
+            result = []
+            for query in queries:
+                result.extend(query(row, node, many, single))
+            return result
+        return plan
+
 
 class First(Call):
 
@@ -315,6 +477,18 @@ class First(Call):
                     return val
         return None
 
+    def compile(self, select):
+        queries = [select.compile(query) for query in self.queries]
+
+        def plan(row, node, many=False, single=True):
+            for query in queries:
+                value = query(row, node, many, single=True)
+                for val in value or []:
+                    if val:
+                        return val
+            return None
+        return plan
+
 
 class OneOf(Call):
 
@@ -332,6 +506,21 @@ class OneOf(Call):
                     return value
         return None
 
+    def compile(self, select):
+        queries = [select.compile(query) for query in self.queries]
+
+        def plan(row, node, many=False, single=True):
+            for query in queries:
+                try:
+                    value = query(row, node, many, single=True)
+                except SelectorError:
+                    pass
+                else:
+                    if value:
+                        return value
+            return None
+        return plan
+
 
 class Subst(Call):
 
@@ -351,6 +540,26 @@ class Subst(Call):
         else:
             return self.subst.get(value, self.default)
 
+    def compile(self, select):
+        query = select.compile(self.query)
+        default = select.compile(self.default) if isinstance(self.default, Expression) else None
+
+        def plan(row, node, many=False, single=True):
+            value = query(row, node, many, single)
+
+            if self.default is Exception:
+                return self.subst[value]
+            elif default:
+                return self.subst.get(value, default(row, node, many, single))
+            else:
+                return self.subst.get(value, self.default)
+        return plan
+
+
+def get_owner(cls, name):
+    """Return class from cls MRO, where attribute name is defined."""
+    return next(c for c in cls.__mro__ if name in c.__dict__)
+
 
 def func(skipna=False):
     def wrapper(func):
@@ -436,5 +645,82 @@ def text(expr, pos, nodes, strip=True, exclude=None):
     return text
 
 
+def get_context_path(node):
+    return node.getroottree().getpath(node)
+
+
+def iter_markup(node):
+    """Yield markup of node in small chunks, in document order.
+
+    Comments and processing instructions are serialized explicitly, because not all lxml versions visit them when
+    walking a tree.
+    """
+    stack = [(node, False)]
+    while stack:
+        elem, end = stack.pop()
+        if isinstance(elem, (lxml.etree._Comment, lxml.etree._ProcessingInstruction, lxml.etree._Entity)):
+            yield lxml.etree.tostring(elem, with_tail=False, encoding='unicode')
+        elif not end:
+            attrs = ''.join(' %s=%s' % (k, quoteattr(v)) for k, v in elem.attrib.items())
+            yield '<%s%s>%s' % (elem.tag, attrs, escape(elem.text or ''))
+            stack.append((elem, True))
+            stack.extend((child, False) for child in reversed(elem))
+            continue
+        else:
+            yield '</%s>' % elem.tag
+        if elem is not node:
+            yield escape(elem.tail or '')
+
+
+def format_context(node, size=None):
+    """Serialize node markup, but not more than size characters.
+
+    Unlike lxml.etree.tostring, only the part of the tree, that fits into size, is visited, so this is cheap even if
+    node is a whole document. By default CONTEXT_SIZE is used as size.
+    """
+    size = CONTEXT_SIZE if size is None else size
+    parts = []
+    length = 0
+    for chunk in iter_markup(node):
+        parts.append(chunk)
+        length += len(chunk)
+        if length > size:
+            return ''.join(parts)[:size] + '...'
+    return ''.join(parts)
+
+
+def get_error_context(row, traceback):
+    """Find context node of the last SelectorError in traceback and return full pretty printed node markup.
+
+    Context nodes are looked up by path in a freshly parsed source row, so full context does not have to be stored with
+    each error.
+    """
+    paths = CONTEXT_PATH_RE.findall(traceback or '')
+    if not paths or not isinstance(row.value, dict) or 'content' not in row.value:
+        return None
+    nodes = create_html_parser(row).xpath(paths[-1])
+    if not nodes:
+        return None
+    return lxml.etree.tostring(nodes[0], pretty_print=True, encoding='unicode')
+
+
 class SelectorError(Exception):
-    pass
+    """Error raised when selector does not match expected number of elements or fails to process selected values.
+
+    Context is an element, on which selector was evaluated. It is formatted only when error is converted to string and
+    only first CONTEXT_SIZE characters are included, together with context path, see get_error_context.
+    """
+
+    def __init__(self, message, context=None):
+        super().__init__(message)
+        self.message = message
+        self.context = context
+
+    def __str__(self):
+        if not isinstance(self.context, lxml.etree._Element):
+            return self.message
+        return '%s Context: %s\n\n%s' % (self.message, get_context_path(self.context), format_context(self.context))
+
+    def __reduce__(self):
+        # Elements can't be pickled, so errors are sent from worker processes already formatted.
+        return SelectorError, (str(self),)
@@ -0,0 +1,62 @@
+import math
+
+
+class KeySet:
+    """Exact in-memory set of serialized keys, see databot.db.serializers.serkey."""
+
+    exact = True
+
+    def __init__(self, capacity=0):
+        self.keys = set()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def add(self, key):
+        self.keys.add(key)
+
+    def full(self):
+        return False
+
+
+class BloomFilter:
+    """Bloom filter of serialized keys.
+
+    Uses about 1.8 bytes per key with default error_rate, compared to about 90 bytes per key of KeySet. False positives
+    are possible, so if a key is found, it must be checked again in the database.
+
+    Serialized keys are sha1 hex digests, so bit positions are taken directly from the key without hashing it again.
+    """
+
+    exact = False
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(capacity, 1024)
+        self.size = int(-self.capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, key):
+        # Double hashing: https://www.eecs.harvard.edu/~michaelm/postscripts/rsa2008.pdf
+        h1 = int(key[:16], 16)
+        h2 = int(key[16:32], 16) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def __contains__(self, key):
+        return all(self.bits[i >> 3] & (1 << (i & 7)) for i in self._positions(key))
+
+    def add(self, key):
+        for i in self._positions(key):
+            self.bits[i >> 3] |= 1 << (i & 7)
+        self.count += 1
+
+    def full(self):
+        """Return True if more keys were added than filter was sized for and false positive rate is too high."""
+        return self.count > self.capacity
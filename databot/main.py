@@ -8,17 +8,23 @@ from databot.db.services import get_pipe_tables
 def main(argv=None, output=sys.stdout):
     argv = argv or sys.argv[1:]
 
+    # Options given before database belong to this parser, everything after database is passed to the bot.
+    n = next((i for i, arg in enumerate(argv) if not arg.startswith('-')), len(argv)) + 1
+
     parser = argparse.ArgumentParser()
+    parser.add_argument('--sqlite-performance', action='store_true', default=False, help=(
+        "Use SQLite performance profile: WAL journal, synchronous=NORMAL, larger cache and memory mapped I/O."
+    ))
     parser.add_argument('db', help='path to sqlite datbase or database connection string')
-    args = parser.parse_args(argv[:1])
-    bot = databot.Bot(args.db, output=output)
+    args = parser.parse_args(argv[:n])
+    bot = databot.Bot(args.db, output=output, sqlite_pragmas=args.sqlite_performance or None)
 
     pipeline = {
         'pipes': [databot.define(pipe.pipe) for pipe in get_pipe_tables(bot)],
         'tasks': [],
     }
 
-    bot.main(pipeline, argv=argv[1:])
+    bot.main(pipeline, argv=argv[n:])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,64 @@
+import collections
+import itertools
+import pickle
+
+
+def imap(executor, func, items, window):
+    """Submit func(item) to an executor, keeping at most `window` items in flight.
+
+    Yields (item, future) pairs in the same order as items were given, so results can be consumed sequentially while
+    next items are being processed in the background. Futures that were not consumed are cancelled when generator is
+    closed.
+
+    Parameters:
+    - executor: concurrent.futures.Executor
+    - func: callable, will be called with a single item
+    - items: iterable
+    - window: int, maximum number of submitted, but not yet consumed items
+
+    Returns: generator
+    """
+    pending = collections.deque()
+    try:
+        for item in items:
+            pending.append((item, executor.submit(func, item)))
+            if len(pending) >= window:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+    finally:
+        for item, future in pending:
+            future.cancel()
+
+
+def chunks(items, size):
+    """Split an iterable into lists of given size, last list can be shorter."""
+    items = iter(items)
+    chunk = list(itertools.islice(items, size))
+    while chunk:
+        yield chunk
+        chunk = list(itertools.islice(items, size))
+
+
+def is_picklable(obj):
+    """Return True if obj can be sent to a worker process."""
+    try:
+        pickle.dumps(obj)
+    except Exception:
+        return False
+    return True
+
+
+def shutdown(executor):
+    """Shut down executor without waiting for running tasks.
+
+    Worker processes of a ProcessPoolExecutor are terminated, so that they do not keep running after interruption.
+    Threads of a ThreadPoolExecutor can't be terminated, they finish their current task in the background.
+    """
+    # ProcessPoolExecutor does not provide a public way to terminate workers.
+    processes = list((getattr(executor, '_processes', None) or {}).values())
+    executor.shutdown(wait=False)
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
@@ -1,24 +1,45 @@
 import collections
+import concurrent.futures
 import datetime
+import functools
 import itertools
+import logging
 import sqlalchemy as sa
 import traceback
 import tqdm
 
-from databot.db.serializers import serrow, serkey
-from databot.db.utils import strip_prefix, create_row, get_or_create, Row
-from databot.db.windowedquery import windowed_query
+from databot.db.serializers import serrow, serkey, dumps
+from databot.db.serializers import get_dictionary_id, register_dictionary, train_dictionary
+from databot.db.serializers import recompress, get_dictionaries
+from databot.db.utils import strip_prefix, create_row, get_or_create, is_memory_db, Row
+from databot.db.windowedquery import windowed_query, iter_query
 from databot.db.models import Compression
 from databot.handlers import download, html
 from databot.bulkinsert import BulkInsert
+from databot.keyindex import KeySet, BloomFilter
+from databot.parallel import imap, chunks, is_picklable, shutdown
 from databot.exporters.services import export
 from databot.expressions.base import Expression
 from databot.tasks import Task
 from databot.services import merge_rows
 
 
+logger = logging.getLogger(__name__)
+
 NONE = object()
 
+# Number of rows sent to a worker process at once.
+CHUNKSIZE = 100
+
+# Maximum number of values in a single IN (...) list, SQLite before 3.32 allows at most 999 query parameters.
+INLIST_SIZE = 500
+
+# Number of rows updated in a single transaction by Pipe.compress and Pipe.decompress.
+BATCHSIZE = 1000
+
+# Default maximum size of a trained compression dictionary, same as zstd command line tool default.
+DICTIONARY_SIZE = 112640
+
 
 def keyvalueitems(key, value=None):
     if isinstance(key, tuple) and value is None and len(key) == 2:
@@ -39,6 +60,112 @@ def keyvalueitems(key, value=None):
         return itertools.chain([(item, None)], ((k, None) for k in items))
 
 
+def evaluate_handler(handler, row):
+    return list(keyvalueitems(handler(row)))
+
+
+def evaluate_handler_chunk(handler, rows):
+    """Evaluate handler for each row, errors are returned together with formatted traceback instead of raising."""
+    results = []
+    for row in rows:
+        try:
+            results.append((evaluate_handler(handler, row), None, None))
+        except Exception as e:
+            results.append((None, e, traceback.format_exc()))
+    return results
+
+
+def get_chunk_result(future, i, row):
+    items, error, tb = future.result()[i]
+    if error is not None:
+        raise error from RemoteTraceback(tb)
+    return items
+
+
+class RemoteTraceback(Exception):
+
+    def __init__(self, tb):
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+def iterhandlers(handler, rows, workers=None, limit=0, processes=False, chunksize=1):
+    """Yield (row, handler) pairs for each row.
+
+    If workers is given, handler is evaluated in advance using a thread pool or a process pool if processes is True.
+    Rows are sent to workers in chunks of chunksize rows. In this case returned handler only gives already evaluated
+    results, raising same exception as handler did. Rows are always returned in the same order as given.
+
+    Handlers that can't be pickled, for example lambdas, can't be sent to worker processes, so they are evaluated in
+    the main process instead. If iteration is interrupted, pending rows are cancelled and worker processes are
+    terminated.
+    """
+    if workers and processes and not is_picklable(handler):
+        logger.warning("Handler %r can't be pickled, it will be evaluated in the main process.", handler)
+        workers = None
+
+    if workers:
+        rows = itertools.islice(rows, limit) if limit else rows
+        Executor = concurrent.futures.ProcessPoolExecutor if processes else concurrent.futures.ThreadPoolExecutor
+        executor = Executor(workers)
+        func = functools.partial(evaluate_handler_chunk, handler)
+        results = imap(executor, func, chunks(rows, chunksize), workers * 2)
+        try:
+            for chunk, future in results:
+                for i, row in enumerate(chunk):
+                    yield row, functools.partial(get_chunk_result, future, i)
+        except BaseException:
+            # Also handles GeneratorExit, when caller stops early, for example on KeyboardInterrupt.
+            results.close()
+            shutdown(executor)
+            raise
+        else:
+            executor.shutdown()
+    else:
+        for row in rows:
+            yield row, handler
+
+
+def select_keys(table):
+    """Select rows for reading keys, value blob is selected only for rows, that do not have rawkey."""
+    value = sa.case([(table.c.rawkey.is_(None), table.c.value)]).label('value')
+    return sa.select([table.c.id, table.c.rawkey, value, table.c.compression])
+
+
+def recompress_chunk(rows, compression, dictionary=None, dictionaries=None):
+    """Recompress a chunk of (id, value, compression) rows.
+
+    Returns list of update parameters for rows, that had to be recompressed. dictionaries are registered before
+    recompressing, when running in another process.
+    """
+    for data in (dictionaries or {}).values():
+        register_dictionary(data)
+    result = []
+    target = None if compression is None else compression.value
+    for id, value, source in rows:
+        if source == target and (compression != Compression.zstd or get_dictionary_id(value) == dictionary):
+            continue
+        source = None if source is None else Compression(source)
+        result.append({
+            '_id': id,
+            '_value': recompress(value, source, compression, dictionary),
+            '_compression': target,
+        })
+    return result
+
+
+def get_compression(compress):
+    """Get Compression member from a member, a member name, True (gzip) or None."""
+    if compress is True:
+        return Compression.gzip
+    elif isinstance(compress, str):
+        return Compression[compress]
+    else:
+        return compress or None
+
+
 class ItemNotFound(Exception):
     pass
 
@@ -49,6 +176,16 @@ class PipeErrors(Task):
         self.task = task
         self.bot = task.bot
 
+        errors = self.bot.models.errors
+        self._retry_query = errors.update(sa.and_(
+            errors.c.state_id == sa.bindparam('_state_id'),
+            errors.c.row_id == sa.bindparam('_row_id'),
+        )).values(
+            retries=errors.c.retries + 1,
+            traceback=sa.bindparam('_traceback'),
+            updated=sa.bindparam('_updated'),
+        )
+
     def __call__(self, key=None, reverse=False):
         if self.task.source:
             state = self.task.get_state()
@@ -85,7 +222,7 @@ class PipeErrors(Task):
                     order_by(order_by)
                 )
 
-                for row in windowed_query(self.task.target.engine, query, table.c.id):
+                for row in windowed_query(self.task.target.engine, query, order_by):
                     item = strip_prefix(row, 'error_')
                     item['row'] = create_row(strip_prefix(row, 'table_'))
                     yield item
@@ -93,11 +230,14 @@ class PipeErrors(Task):
             # Query if some tables are stored in external database
             else:
                 query = error.select(where).order_by(order_by)
-                for err in windowed_query(self.task.target.engine, query, error.c.id):
-                    query = table.select(table.c.id == err['row_id'])
-                    row = self.task.source.engine.execute(query).first()
-                    if row:
-                        yield Row(err, row=create_row(row))
+                errors = windowed_query(self.task.target.engine, query, order_by, INLIST_SIZE)
+                for window in chunks(errors, INLIST_SIZE):
+                    row_ids = {err['row_id'] for err in window}
+                    query = table.select(table.c.id.in_(row_ids))
+                    rows = {row['id']: row for row in self.task.source.engine.execute(query)}
+                    for err in window:
+                        if err['row_id'] in rows:
+                            yield Row(err, row=create_row(rows[err['row_id']]))
 
     def last(self, key=None):
         for err in self(key, reverse=True):
@@ -131,16 +271,11 @@ class PipeErrors(Task):
         now = datetime.datetime.utcnow()
         if 'retries' in error_or_row:
             error = error_or_row
-            self.task.target.engine.execute(
-                self.bot.models.errors.update(sa.and_(
-                    self.bot.models.errors.c.state_id == error.state_id,
-                    self.bot.models.errors.c.row_id == error.row_id,
-                )).values(
-                    retries=self.bot.models.errors.c.retries + 1,
-                    traceback=message,
-                    updated=datetime.datetime.utcnow(),
-                ),
-            )
+            params = dict(_state_id=error.state_id, _row_id=error.row_id, _traceback=message, _updated=now)
+            if bulk:
+                bulk.execute(self._retry_query, params)
+            else:
+                self.task.target.engine.execute(self._retry_query, params)
         elif bulk:
             row = error_or_row
             state = self.task.get_state()
@@ -151,7 +286,7 @@ class PipeErrors(Task):
                 traceback=message,
                 created=now,
                 updated=now,
-            ))
+            ), table=self.bot.models.errors)
         else:
             row = error_or_row
             state = self.task.get_state()
@@ -173,26 +308,143 @@ class PipeErrors(Task):
 
             if key is None:
                 self.task.target.engine.execute(error.delete(error.c.state_id == state.id))
-            elif self.task.target.samedb and self.task.source.samedb:
-                query = (
-                    sa.select([error.c.id]).
-                    select_from(table.join(error, table.c.id == error.c.row_id)).
-                    where(sa.and_(error.c.state_id == state.id, table.c.key == serkey(key)))
-                )
-
-                if self.bot.engine.name == 'mysql':
-                    # http://stackoverflow.com/a/45498/475477
-                    query = sa.select([query.alias().c.id])
-
-                self.task.target.engine.execute(error.delete(error.c.id.in_(query)))
             else:
-                query = table.select(table.c.key == serkey(key))
+                # Source row ids are looked up first, this way both key and errors indexes are used, even if pipes
+                # are in different databases.
+                query = sa.select([table.c.id]).where(table.c.key == serkey(key))
                 row_ids = {row['id'] for row in self.task.source.engine.execute(query)}
                 if row_ids:
                     query = error.delete(sa.and_(error.c.state_id == state.id, error.c.row_id.in_(row_ids)))
                     self.task.target.engine.execute(query)
 
 
+class TaskCall:
+    """Process source rows of a task one by one and append results to the target pipe, see TaskPipe.call.
+
+    Target rows, error rows and state offset are saved in a single transaction.
+    """
+
+    def __init__(self, task, error_limit):
+        self.task = task
+        self.bot = task.bot
+        self.error_limit = error_limit
+        self.state = task.get_state()
+        self.offset = self.state.offset
+        self.n = 0
+        self.n_errors = 0
+        self.last_row = None
+        self.interrupt = None
+
+        background = self.bot.background_writes and not is_memory_db(task.target.engine)
+        self.pipe = BulkInsert(task.target.engine, task.target.table, background=background)
+        if not self.bot.debug:
+            self.pipe.post_save(self.post_save, self.checkpoint)
+
+    def checkpoint(self):
+        # Only rows, that were fully processed, are marked as done.
+        return self.last_row.id if self.last_row else None
+
+    def post_save(self, conn, offset):
+        if offset:
+            self.task._update_offset(offset, conn, self.state)
+
+    def __call__(self, row, handler):
+        """Process a single row, returns False if no more rows should be processed."""
+        task = self.task
+
+        if self.bot.limit and self.n >= self.bot.limit:
+            return False
+
+        if self.bot.debug:
+            task._verbose_append(handler, row, self.pipe, append=False)
+        else:
+            try:
+                if self.bot.verbosity > 1:
+                    task._verbose_append(handler, row, self.pipe)
+                else:
+                    task.target.append(handler(row), bulk=self.pipe)
+            except KeyboardInterrupt as e:
+                self.interrupt = e
+                self.last_row = row
+                return False
+            except Exception as e:
+                self.n_errors += 1
+                if self.error_limit is not None and self.n_errors >= self.error_limit:
+                    self.interrupt = e
+                    if self.bot.verbosity > 0:
+                        print('Interrupting bot because error limit of %d was reached.' % self.error_limit)
+                        self.bot.output.key_value(row.key, row.value, short=True)
+                    if self.error_limit > 0:
+                        task.errors.report(row, traceback.format_exc(), self.pipe)
+                    return False
+                else:
+                    task.errors.report(row, traceback.format_exc(), self.pipe)
+        self.n += 1
+        self.last_row = row
+        return True
+
+    def close(self, raise_interrupt=True):
+        self.pipe.save(post_save=True)
+        self.pipe.close()
+
+        if self.bot.verbosity > 1:
+            print('%s -> %s, rows processed: %d' % (self.task.source, self.task.target, self.n))
+
+        if self.interrupt and raise_interrupt:
+            raise self.interrupt
+
+
+def shared_scan(source, tasks, error_limit=NONE):
+    """Run multiple tasks reading same source pipe in a single pass over source rows.
+
+    Parameters
+    ----------
+    source : Pipe
+    tasks : list of (TaskPipe, handler) pairs
+        Tasks, having source pipe as source.
+    error_limit : int, optional
+        Stop a task after specified number of errors. By default `bot.error_limit` is used.
+
+    Each source row is read and decoded once and the same row object is passed to handlers of all tasks, that have not
+    processed it yet. html.Select handlers also share the parsed HTML tree. Each task keeps its own offset, target and
+    errors. Handlers are evaluated in this process, workers are not used.
+    """
+    bot = source.bot
+    error_limit = bot.error_limit if error_limit is NONE else error_limit
+
+    if bot.retry:
+        for task, handler in tasks:
+            task.retry(handler)
+
+    parser = html.SharedParser()
+    for task, handler in tasks:
+        if isinstance(handler, html.Select):
+            handler.parser = parser
+
+    calls = [(TaskCall(task, error_limit), handler) for task, handler in tasks]
+    offset = min(call.offset for call, handler in calls)
+    table = source.table
+    query = table.select(table.c.id > offset)
+    rows = (create_row(row) for row in iter_query(source.engine, query, table.c.id))
+    if bot.verbosity == 1 and not bot.debug:
+        desc = '%s -> %s' % (source, ', '.join(str(task.target) for task, handler in tasks))
+        total = source.engine.execute(table.count(table.c.id > offset)).scalar()
+        rows = tqdm.tqdm(rows, desc, total, leave=True)
+
+    active = calls
+    for row in rows:
+        active = [(call, handler) for call, handler in active if row.id <= call.offset or call(row, handler)]
+        if not active or any(isinstance(call.interrupt, KeyboardInterrupt) for call, handler in calls):
+            break
+
+    # All tasks are saved, before the first interrupt is raised.
+    for call, handler in calls:
+        call.close(raise_interrupt=False)
+    for call, handler in calls:
+        if call.interrupt:
+            raise call.interrupt
+
+
 class TaskPipe(Task):
 
     def __init__(self, bot, source, target):
@@ -201,6 +453,7 @@ class TaskPipe(Task):
         self.source = source
         self.target = target
         self.errors = PipeErrors(self)
+        self._state = None
 
     def __repr__(self):
         return '<databot.pipes.TaskPipe(%r, %r) at 0x%x>' % (
@@ -210,11 +463,23 @@ class TaskPipe(Task):
         )
 
     def get_state(self):
-        return get_or_create(self.target.engine, self.target.models.state, ['source_id', 'target_id'], dict(
-            source_id=(self.source.id if self.source else None),
-            target_id=self.target.id,
-            offset=0,
-        ))
+        """Get state row of this task, state row is queried once and cached until offset is changed."""
+        if self._state is None:
+            self._state = get_or_create(self.target.engine, self.target.models.state, ['source_id', 'target_id'], dict(
+                source_id=(self.source.id if self.source else None),
+                target_id=self.target.id,
+                offset=0,
+            ))
+        return self._state
+
+    def _update_offset(self, offset, conn=None, state=None):
+        conn = conn or self.target.engine
+        state = state or self.get_state()
+        models = self.target.models
+        conn.execute(models.state.update(models.state.c.id == state.id), offset=offset)
+        # Offset might be updated in a transaction, that is not committed yet, so cached state is dropped instead of
+        # being updated.
+        self._state = None
 
     def is_filled(self):
         if self.source:
@@ -226,21 +491,15 @@ class TaskPipe(Task):
             return False
 
     def reset(self):
-        engine = self.target.engine
-        models = self.target.models
-        state = self.get_state()
-        engine.execute(models.state.update(models.state.c.id == state.id), offset=0)
+        self._update_offset(0)
         return self
 
     def skip(self):
-        engine = self.target.engine
-        models = self.target.models
-        state = self.get_state()
         source = self.source.table
         query = sa.select([source.c.id]).order_by(source.c.id.desc()).limit(1)
         offset = self.source.engine.execute(query).scalar()
         if offset:
-            engine.execute(models.state.update(models.state.c.id == state.id), offset=offset)
+            self._update_offset(offset)
         return self
 
     def offset(self, value=None):
@@ -278,10 +537,7 @@ class TaskPipe(Task):
                 else:
                     return self.reset()
         if offset is not None:
-            self.target.engine.execute(
-                self.target.models.state.update(self.target.models.state.c.id == state.id),
-                offset=offset,
-            )
+            self._update_offset(offset)
         return self
 
     def count(self):
@@ -297,7 +553,7 @@ class TaskPipe(Task):
         if self.source:
             table = self.source.table
             query = table.select(table.c.id > self.get_state().offset).order_by(table.c.id)
-            for row in windowed_query(self.source.engine, query, table.c.id):
+            for row in iter_query(self.source.engine, query, table.c.id):
                 yield create_row(row)
 
     def items(self):
@@ -305,8 +561,11 @@ class TaskPipe(Task):
             yield row.key, row.value
 
     def keys(self):
-        for row in self.rows():
-            yield row.key
+        if self.source:
+            table = self.source.table
+            query = select_keys(table).where(table.c.id > self.get_state().offset)
+            for row in iter_query(self.source.engine, query, table.c.id):
+                yield create_row(dict(row)).key
 
     def values(self):
         for row in self.rows():
@@ -320,10 +579,27 @@ class TaskPipe(Task):
                 self.target.append(key, value, bulk=bulk)
             self.bot.output.key_value(key, value, short=True)
 
-    def call(self, handler, error_limit=NONE):
+    def call(self, handler, error_limit=NONE, workers=NONE, threads=False):
+        """Call handler for each unprocessed source row and append results to the target pipe.
+
+        Parameters
+        ----------
+        handler : callable
+            Takes a source row and returns items to be appended, see `Pipe.append`.
+        error_limit : int, optional
+            Stop after specified number of errors. By default `bot.error_limit` is used.
+        workers : int, optional
+            Number of workers to evaluate handler in parallel. By default `bot.workers` is used.
+
+            Rows are sent to a process pool in ordered chunks, so handler must be picklable. Results are appended in
+            the same order as source rows and state offset is advanced only past rows that were processed.
+        threads : bool, optional
+            Use a thread pool instead of a process pool, suitable for handlers that are not CPU-bound.
+
+        """
         error_limit = self.bot.error_limit if error_limit is NONE else error_limit
+        workers = self.bot.workers if workers is NONE else workers
 
-        state = self.get_state()
         desc = '%s -> %s' % (self.source, self.target)
 
         if self.bot.retry:
@@ -335,63 +611,16 @@ class TaskPipe(Task):
         else:
             rows = self.rows()
 
-        def post_save():
-            if row:
-                engine = self.target.engine
-                models = self.target.models
-                engine.execute(models.state.update(models.state.c.id == state.id), offset=row.id)
-
-        pipe = BulkInsert(self.target.engine, self.target.table)
-        errors = BulkInsert(self.target.engine, self.target.models.errors)
-
-        if not self.bot.debug:
-            pipe.post_save(post_save)
-
-        n = 0
-        n_errors = 0
-        row = None
-        interrupt = None
-        last_row = None
-        for row in rows:
-            if self.bot.limit and n >= self.bot.limit:
-                row = last_row
+        call = TaskCall(self, error_limit)
+        if threads:
+            handlers = iterhandlers(handler, rows, workers, self.bot.limit)
+        else:
+            handlers = iterhandlers(handler, rows, workers, self.bot.limit, processes=True, chunksize=CHUNKSIZE)
+        for row, handler in handlers:
+            if not call(row, handler):
                 break
-
-            if self.bot.debug:
-                self._verbose_append(handler, row, pipe, append=False)
-            else:
-                try:
-                    if self.bot.verbosity > 1:
-                        self._verbose_append(handler, row, pipe)
-                    else:
-                        self.target.append(handler(row), bulk=pipe)
-                except KeyboardInterrupt as e:
-                    interrupt = e
-                    break
-                except Exception as e:
-                    n_errors += 1
-                    if error_limit is not None and n_errors >= error_limit:
-                        interrupt = e
-                        if self.bot.verbosity > 0:
-                            print('Interrupting bot because error limit of %d was reached.' % error_limit)
-                            self.bot.output.key_value(row.key, row.value, short=True)
-                        if error_limit > 0:
-                            self.errors.report(row, traceback.format_exc(), errors)
-                        row = last_row
-                        break
-                    else:
-                        self.errors.report(row, traceback.format_exc(), errors)
-            n += 1
-            last_row = row
-
-        pipe.save(post_save=True)
-        errors.save()
-
-        if self.bot.verbosity > 1:
-            print('%s, rows processed: %d' % (desc, n))
-
-        if interrupt:
-            raise interrupt
+        handlers.close()
+        call.close()
 
         return self
 
@@ -404,16 +633,19 @@ class TaskPipe(Task):
         else:
             errors = self.errors()
 
-        def post_save():
+        def checkpoint():
             nonlocal error_ids
-            if error_ids:
-                engine = self.target.engine
+            ids, error_ids = error_ids, []
+            return ids
+
+        def post_save(conn, ids):
+            if ids:
                 models = self.target.models
-                engine.execute(models.errors.delete(models.errors.c.id.in_(error_ids)))
-                error_ids = []
+                conn.execute(models.errors.delete(models.errors.c.id.in_(ids)))
 
-        pipe = BulkInsert(self.target.engine, self.target.table)
-        pipe.post_save(post_save)
+        background = self.bot.background_writes and not is_memory_db(self.target.engine)
+        pipe = BulkInsert(self.target.engine, self.target.table, background=background)
+        pipe.post_save(post_save, checkpoint)
 
         n = 0
         interrupt = None
@@ -435,12 +667,13 @@ class TaskPipe(Task):
                     interrupt = e
                     break
                 except:
-                    self.errors.report(error, traceback.format_exc())
+                    self.errors.report(error, traceback.format_exc(), pipe)
                 else:
                     error_ids.append(error.id)
             n += 1
 
         pipe.save(post_save=True)
+        pipe.close()
 
         if self.bot.verbosity > 1:
             print('%s, errors retried: %d' % (desc, n))
@@ -450,19 +683,22 @@ class TaskPipe(Task):
 
         return self
 
-    def download(self, urls=None, **kwargs):
+    def download(self, urls=None, workers=None, host_workers=1, **kwargs):
         kwargs.setdefault('delay', self.bot.download_delay)
+        workers = self.bot.workers if workers is None else workers
+        if workers:
+            kwargs['throttle'] = download.HostThrottle(host_workers, kwargs.pop('delay'))
         urls = urls or Expression().key
-        return self.call(download.download(self.bot.requests, urls, **kwargs))
+        return self.call(download.download(self.bot.requests, urls, **kwargs), workers=workers, threads=True)
 
     def select(self, key, value=None, **kwargs):
         return self.call(html.Select(key, value, **kwargs))
 
-    def dedup(self):
-        self.target.dedup()
+    def dedup(self, incremental=False):
+        self.target.dedup(incremental)
 
-    def compact(self):
-        self.target.compact()
+    def compact(self, incremental=False):
+        self.target.compact(incremental)
 
     def age(self, key=None):
         return self.target.age(key)
@@ -481,7 +717,7 @@ class TaskPipe(Task):
 
 
 class Pipe(Task):
-    def __init__(self, bot, id, name, table, engine, samedb=True, compress=None):
+    def __init__(self, bot, id, name, table, engine, samedb=True, compress=None, bloom=False):
         """
 
         Parameters
@@ -498,8 +734,10 @@ class Pipe(Task):
             Identifies if this pipe is stored in same database as other pipes of ``bot``.
 
             If a pipe is stored in an external database, some queries will be executed in a bit different way.
-        compress : databot.db.models.Compression or bool, optional
-            Data compression algorithm.
+        compress : databot.db.models.Compression or str or bool, optional
+            Data compression algorithm, can be given as a ``Compression`` member name, True means gzip.
+        bloom : bool
+            Use a Bloom filter instead of an exact set of keys for ``append(only_missing=True)`` checks.
         """
         super().__init__()
         self.bot = bot
@@ -509,7 +747,10 @@ class Pipe(Task):
         self.models = bot.models
         self.engine = engine
         self.samedb = samedb
-        self.compression = Compression.gzip if compress is True else compress
+        self.compression = get_compression(compress)
+        self.dictionary = None  # id of zstd dictionary used for compression, see Pipe.train
+        self.bloom = bloom
+        self._keys = None  # in-memory index of serialized keys, see Pipe.get_keys
         self.tasks = {}
 
     def __str__(self):
@@ -550,11 +791,18 @@ class Pipe(Task):
             bulk = BulkInsert(conn, self.table)
 
         # Append
+        keys = self.get_keys(bulk) if only_missing else self._keys
         for key, value in rows:
             # Skip all items if key is None
-            if key is not None and (not only_missing or not self.exists(key)):
-                now = datetime.datetime.utcnow()
-                bulk.append(serrow(key, value, created=now, compression=self.compression))
+            if key is None:
+                continue
+            if keys is not None:
+                hashed = serkey(key)
+                if only_missing and hashed in keys and (keys.exact or self._exists(hashed, bulk)):
+                    continue
+                keys.add(hashed)
+            now = datetime.datetime.utcnow()
+            bulk.append(serrow(key, value, created=now, compression=self.compression, dictionary=self.dictionary))
 
         # Bulk insert finish
         if save_bulk:
@@ -576,55 +824,71 @@ class Pipe(Task):
         else:
             query = self.table.delete()
         self.engine.execute(query)
+        self._keys = None
+        # Deleted ids can be reused, so incremental dedup and compact have to start from scratch.
+        self.bot.engine.execute(self.models.marks.delete(self.models.marks.c.pipe_id == self.id))
         return self
 
-    def dedup(self):
-        """Delete all records with duplicate keys except ones created first."""
-        agg = (
-            sa.select([self.table.c.key, sa.func.min(self.table.c.id).label('id')]).
-            group_by(self.table.c.key).
-            having(sa.func.count(self.table.c.id) > 1).
-            alias()
-        )
+    def dedup(self, incremental=False):
+        """Delete all records with duplicate keys except ones created first.
 
-        query = (
-            sa.select([self.table.c.id]).
-            select_from(self.table.join(agg, sa.and_(
-                self.table.c.key == agg.c.key,
-                self.table.c.id != agg.c.id,
-            )))
-        )
+        If incremental is True, only keys of rows appended after last dedup are checked.
+        """
+        self._delete_duplicates('dedup', sa.func.min, incremental)
+        return self
 
-        if self.engine.name == 'mysql':
-            # http://stackoverflow.com/a/45498/475477
-            query = sa.select([query.alias().c.id])
+    def compact(self, incremental=False):
+        """Delete all records with duplicate keys except ones created last.
 
-        self.engine.execute(self.table.delete(self.table.c.id.in_(query)))
+        If incremental is True, only keys of rows appended after last compact are checked.
+        """
+        self._delete_duplicates('compact', sa.func.max, incremental)
         return self
 
-    def compact(self):
-        """Delete all records with duplicate keys except ones created last."""
-        agg = (
-            sa.select([self.table.c.key, sa.func.max(self.table.c.id).label('id')]).
-            group_by(self.table.c.key).
-            having(sa.func.count(self.table.c.id) > 1).
-            alias()
-        )
+    def _delete_duplicates(self, name, keep, incremental):
+        # All keys up to the high-water mark are known to be unique after previous run, so in incremental mode only
+        # keys of newer rows are checked. Duplicates are deleted in chunks of keys with an explicit list of ids, to
+        # avoid a single huge delete with a subquery, holding locks for the whole time.
+        table = self.table
+        start = self.engine.execute(sa.select([sa.func.max(table.c.id)])).scalar()
+        mark = self._get_mark(name) if incremental else None
 
-        query = (
-            sa.select([self.table.c.id]).
-            select_from(self.table.join(agg, sa.and_(
-                self.table.c.key == agg.c.key,
-                self.table.c.id != agg.c.id,
-            )))
-        )
+        query = sa.select([table.c.key]).group_by(table.c.key)
+        if mark:
+            query = query.where(table.c.id > mark)
+        else:
+            query = query.having(sa.func.count(table.c.id) > 1)
+
+        keys = (row[table.c.key] for row in windowed_query(self.engine, query, table.c.key, INLIST_SIZE))
+        for chunk in chunks(keys, INLIST_SIZE):
+            agg = (
+                sa.select([table.c.key, keep(table.c.id).label('id')]).
+                where(table.c.key.in_(chunk)).
+                group_by(table.c.key).
+                alias()
+            )
+            query = (
+                sa.select([table.c.id]).
+                select_from(table.join(agg, sa.and_(table.c.key == agg.c.key, table.c.id != agg.c.id)))
+            )
+            ids = [row[table.c.id] for row in self.engine.execute(query)]
+            for ids in chunks(ids, INLIST_SIZE):
+                self.engine.execute(table.delete(table.c.id.in_(ids)))
 
-        if self.engine.name == 'mysql':
-            # http://stackoverflow.com/a/45498/475477
-            query = sa.select([query.alias().c.id])
+        # Deleted ids can be reused by new rows, so mark is never set above current last id.
+        end = self.engine.execute(sa.select([sa.func.max(table.c.id)])).scalar()
+        self._set_mark(name, min(start or 0, end or 0))
 
-        self.engine.execute(self.table.delete(self.table.c.id.in_(query)))
-        return self
+    def _get_mark(self, name):
+        marks = self.models.marks
+        query = sa.select([marks.c.value]).where(sa.and_(marks.c.pipe_id == self.id, marks.c.name == name))
+        return self.bot.engine.execute(query).scalar()
+
+    def _set_mark(self, name, value):
+        marks = self.models.marks
+        where = sa.and_(marks.c.pipe_id == self.id, marks.c.name == name)
+        if self.bot.engine.execute(marks.update(where).values(value=value)).rowcount == 0:
+            self.bot.engine.execute(marks.insert().values(pipe_id=self.id, name=name, value=value))
 
     def merge(self):
         """Merge all duplicate value, newer values overwrites older values.
@@ -634,30 +898,114 @@ class Pipe(Task):
         After merge, old values will be left as is, use compact to remove them.
 
         """
-        query = self.table.select().order_by(self.table.c.key, self.table.c.created)
-        rows = (create_row(row) for row in windowed_query(self.engine, query, self.table.c.id))
-        self.append(merge_rows((row.key, row.value) for row in rows))
+        # Only keys having more than one row are read, in windows of INLIST_SIZE keys, so memory usage does not
+        # depend on pipe size. Merged rows are always appended for keys already processed, so they are not seen again
+        # by following windows.
+        table = self.table
+        query = sa.select([table.c.key]).group_by(table.c.key).having(sa.func.count(table.c.id) > 1)
+        keys = (row[table.c.key] for row in windowed_query(self.engine, query, table.c.key, INLIST_SIZE))
+        bulk = BulkInsert(self.engine, table)
+        for chunk in chunks(keys, INLIST_SIZE):
+            query = (
+                table.select().
+                where(table.c.key.in_(chunk)).
+                order_by(table.c.key, table.c.created, table.c.id)
+            )
+            rows = (create_row(row) for row in self.engine.execute(query).fetchall())
+            self.append(merge_rows((row.key, row.value) for row in rows), bulk=bulk)
+        bulk.save()
         return self
 
-    def compress(self):
-        table = self.table
-        rows = self.rows()
-        if self.bot.verbosity == 1:
-            rows = tqdm.tqdm(rows, ('compress %s' % self.name), total=self.count(), file=self.bot.output.output)
-        for row in rows:
-            if row.compression != Compression.gzip:
-                data = serrow(row.key, row.value, created=row.created, compression=Compression.gzip)
-                self.engine.execute(table.update().where(table.c.id == row['id']).values(data))
+    def compress(self, compression=None, workers=None, batchsize=BATCHSIZE):
+        """Compress all rows, that are not compressed with given compression algorithm.
 
-    def decompress(self):
+        By default compression algorithm of this pipe is used or gzip if pipe is not compressed. If pipe has a trained
+        dictionary, zstd compression uses it and rows compressed with another or without dictionary are recompressed.
+
+        Rows are updated in transactions of batchsize rows, so if compression is interrupted, already compressed rows
+        are kept and skipped next time. If workers is given, rows are compressed using a pool of worker processes.
+        """
+        compression = get_compression(compression) or self.compression or Compression.gzip
+        dictionary = self.dictionary if compression == Compression.zstd else None
+        self._recompress('compress', compression, dictionary, workers, batchsize)
+
+    def decompress(self, workers=None, batchsize=BATCHSIZE):
+        """Decompress all compressed rows, see Pipe.compress."""
+        self._recompress('decompress', None, None, workers, batchsize)
+
+    def _recompress(self, action, compression, dictionary, workers, batchsize):
         table = self.table
-        rows = self.rows()
+        query = sa.select([table.c.id, table.c.value, table.c.compression])
+        if compression is None:
+            query = query.where(table.c.compression.isnot(None))
+        elif dictionary is None:
+            query = query.where(sa.or_(table.c.compression != compression.value, table.c.compression.is_(None)))
+        total = self.engine.execute(sa.select([sa.func.count()]).select_from(query.alias())).scalar()
+
+        rows = iter_query(self.engine, query, table.c.id, batchsize)
         if self.bot.verbosity == 1:
-            rows = tqdm.tqdm(rows, ('decompress %s' % self.name), total=self.count(), file=self.bot.output.output)
-        for row in rows:
-            if row.compression is not None:
-                data = serrow(row.key, row.value, created=row.created, compression=None)
-                self.engine.execute(table.update().where(table.c.id == row['id']).values(data))
+            rows = tqdm.tqdm(rows, ('%s %s' % (action, self.name)), total=total, file=self.bot.output.output)
+        rows = ((row['id'], row['value'], row['compression']) for row in rows)
+
+        update = table.update().where(table.c.id == sa.bindparam('_id')).values(
+            value=sa.bindparam('_value'),
+            compression=sa.bindparam('_compression'),
+        )
+
+        if workers:
+            func = functools.partial(recompress_chunk, compression=compression, dictionary=dictionary,
+                                     dictionaries=get_dictionaries())
+            with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+                for chunk, future in imap(executor, func, chunks(rows, batchsize), workers * 2):
+                    self._update_chunk(update, future.result())
+        else:
+            for chunk in chunks(rows, batchsize):
+                self._update_chunk(update, recompress_chunk(chunk, compression, dictionary))
+
+    def _update_chunk(self, update, params):
+        if params:
+            with self.engine.begin() as conn:
+                conn.execute(update, params)
+
+    def load_dictionaries(self):
+        """Register all compression dictionaries of this pipe, last trained dictionary is used for compression."""
+        dictionaries = self.models.dictionaries
+        query = dictionaries.select(dictionaries.c.pipe_id == self.id).order_by(dictionaries.c.id)
+        for row in self.bot.engine.execute(query):
+            self.dictionary = register_dictionary(row['data'])
+        return self
+
+    def train(self, samples=1000, size=DICTIONARY_SIZE):
+        """Train zstd compression dictionary from a sample of this pipe rows.
+
+        Trained dictionary is stored in the database and is used for all new zstd compressed rows of this pipe. In
+        order to recompress existing rows, call ``compress('zstd')``. Dictionaries are useful when values are small and
+        similar, for example pages of the same site.
+
+        Parameters
+        ----------
+        samples : int
+            Number of rows, evenly spread across the whole pipe, used for training.
+        size : int
+            Maximum dictionary size in bytes.
+
+        Returns
+        -------
+        int
+            Trained dictionary id.
+        """
+        step = max(self.count() // samples, 1)
+        rows = itertools.islice(self.rows(), 0, None, step)
+        data = train_dictionary([dumps([row.key, row.value]) for row in rows], size)
+        self.bot.engine.execute(
+            self.models.dictionaries.insert(),
+            pipe_id=self.id,
+            compression=Compression.zstd.value,
+            data=data,
+            created=datetime.datetime.utcnow(),
+        )
+        self.dictionary = register_dictionary(data)
+        return self.dictionary
 
     def last(self, key=None):
         if key:
@@ -678,7 +1026,7 @@ class Pipe(Task):
     def rows(self, desc=False):
         order_by = self.table.c.id.desc() if desc else self.table.c.id
         query = self.table.select().order_by(order_by)
-        for row in windowed_query(self.engine, query, self.table.c.id):
+        for row in iter_query(self.engine, query, order_by):
             yield create_row(row)
 
     def items(self):
@@ -686,21 +1034,51 @@ class Pipe(Task):
             yield row.key, row.value
 
     def keys(self):
-        for row in self.rows():
-            yield row.key
+        query = select_keys(self.table)
+        for row in iter_query(self.engine, query, self.table.c.id):
+            yield create_row(dict(row)).key
 
     def values(self):
         for row in self.rows():
             yield row.value
 
     def exists(self, key):
-        query = sa.select([sa.exists().where(self.table.c.key == serkey(key))])
-        return self.engine.execute(query).scalar()
+        return self._exists(serkey(key))
+
+    def _exists(self, key, bulk=None):
+        query = sa.select([sa.exists().where(self.table.c.key == key)])
+        if self.engine.execute(query).scalar():
+            return True
+        if bulk is not None:
+            # Key can be in rows, that are appended, but not yet written.
+            bulk.flush()
+            return self.engine.execute(query).scalar()
+        return False
+
+    def get_keys(self, bulk=None):
+        """Return in-memory index of serialized keys of this pipe, used by ``append(only_missing=True)``.
+
+        Index is loaded from the key column on first use and then updated by each append, so only_missing checks do not
+        query the database. Rows appended by other processes are not seen until the index is loaded again, after
+        Pipe.clean or when a Bloom filter gets full. Before loading the index, rows buffered in bulk are written, so
+        that their keys are not lost.
+        """
+        if self._keys is None or self._keys.full():
+            if bulk is not None:
+                bulk.flush()
+            table = self.table
+            count = self.engine.execute(sa.select([sa.func.count(table.c.id)])).scalar()
+            keys = (BloomFilter if self.bloom else KeySet)(count * 2)
+            query = sa.select([table.c.id, table.c.key])
+            for row in iter_query(self.engine, query, table.c.id):
+                keys.add(row[table.c.key])
+            self._keys = keys
+        return self._keys
 
     def getall(self, key, reverse=False):
         order_by = self.table.c.id.desc() if reverse else self.table.c.id
         query = self.table.select().where(self.table.c.key == serkey(key)).order_by(order_by)
-        for row in windowed_query(self.engine, query, self.table.c.id):
+        for row in windowed_query(self.engine, query, order_by):
             yield create_row(row)
 
     def get(self, key, default=Exception):
@@ -722,7 +1100,7 @@ class Pipe(Task):
     def export(self, dest, **kwargs):
         return export(self.rows(), dest, **kwargs)
 
-    def download(self, urls=None, **kwargs):
+    def download(self, urls=None, workers=None, host_workers=1, **kwargs):
         """Download list of URLs and store downloaded content into a pipe.
 
         Parameters
@@ -754,15 +1132,28 @@ class Pipe(Task):
         delay : int
             Amount of seconds to delay between requests.
 
-            By default delay is `bot.download_delay`.
+            By default delay is `bot.download_delay`. If workers are used, delay is applied between requests to the
+            same host.
+
+        workers : int, optional
+            Number of concurrent downloads. By default `bot.workers` is used, if it is not set, all URLs are downloaded
+            one by one.
+
+            Downloaded content is stored in the same order as URLs were given.
+
+        host_workers : int, optional
+            Maximum number of concurrent downloads from the same host, used only with workers.
 
         """
         kwargs.setdefault('delay', self.bot.download_delay)
+        workers = self.bot.workers if workers is None else workers
+        if workers:
+            kwargs['throttle'] = download.HostThrottle(host_workers, kwargs.pop('delay'))
 
         urls = [urls] if isinstance(urls, str) else urls
         fetch = download.download(self.bot.requests, urls, **kwargs)
 
-        for url in urls:
+        for url, fetch in iterhandlers(fetch, urls, workers):
             try:
                 self.append(fetch(url))
             except KeyboardInterrupt:
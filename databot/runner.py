@@ -1,6 +1,9 @@
 import logging
 
 from databot.expressions.utils import handler
+from databot.expressions.base import Method
+from databot.handlers import html
+from databot.pipes import shared_scan
 
 logger = logging.getLogger(__name__)
 
@@ -22,20 +25,56 @@ def task(expr, pos, bot, source=None, target=None, watch=False):
         return bot
 
 
-def run_single_task(bot, expr, source, target):
+def is_selected(expr, source, target):
     task = expr._stack[0]
-
-    logger.debug('run_single_task: %s', ', '.join(task.args))
-
-    if (
+    return (
         (source, target) == (None, None) or
         (source and target and (source.name, target.name) == task.args) or
         (source and target is None and (source.name,) == task.args) or
         (source and target is None and len(task.args) == 2 and (source.name,) == task.args[1:])
-    ):
+    )
+
+
+def run_single_task(bot, expr, source, target):
+    task = expr._stack[0]
+
+    logger.debug('run_single_task: %s', ', '.join(task.args))
+
+    if is_selected(expr, source, target):
         expr._eval(bot)
 
 
+def get_select_source(expr):
+    """Return source pipe name if expr is a plain ``task(source, target).select(...)`` task, otherwise None."""
+    task, *methods = expr._stack
+    if len(task.args) == 2 and len(methods) == 1 and isinstance(methods[0], Method) and methods[0].name == 'select':
+        return task.args[0]
+    return None
+
+
+def get_task_groups(bot, tasks, source, target):
+    """Group consecutive select tasks reading same source pipe, if bot.shared_scan is enabled."""
+    groups = []
+    for expr in tasks:
+        name = get_select_source(expr) if bot.shared_scan and is_selected(expr, source, target) else None
+        if name and groups and get_select_source(groups[-1][0]) == name and is_selected(groups[-1][0], source, target):
+            groups[-1].append(expr)
+        else:
+            groups.append([expr])
+    return groups
+
+
+def run_shared_scan(bot, exprs):
+    tasks = []
+    for expr in exprs:
+        task, (method,) = expr._eval_head(bot, 1)
+        tasks.append((task, html.Select(*method.args, **method.kwargs)))
+
+    logger.debug('run_shared_scan: %s', ', '.join(repr(task) for task, handler in tasks))
+
+    shared_scan(tasks[0][0].source, tasks)
+
+
 def get_watching_tasks(bot, tasks):
     for expr in tasks:
         task = expr._stack[0]
@@ -65,6 +104,9 @@ def run_all_tasks(bot, tasks, source=None, target=None):
 
     watching_tasks = list(get_watching_tasks(bot, tasks))
 
-    for expr in tasks:
-        run_single_task(bot, expr, source, target)
+    for group in get_task_groups(bot, tasks, source, target):
+        if len(group) > 1:
+            run_shared_scan(bot, group)
+        else:
+            run_single_task(bot, group[0], source, target)
         run_watching_tasks(bot, watching_tasks, source, target)
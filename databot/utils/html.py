@@ -1,5 +1,22 @@
+import re
 import bs4
 import cgi
+import codecs
+
+# Longer BOMs first, UTF-32 LE BOM starts with UTF-16 LE BOM.
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# Matches both <meta charset="..."> and <meta http-equiv="Content-Type" content="text/html; charset=...">.
+META_CHARSET_RE = re.compile(br'<meta[^>]+charset\s*=\s*["\']?\s*([a-z0-9_:.-]+)', re.IGNORECASE)
+META_TAG_RE = re.compile(br'<meta\s[^>]*>', re.IGNORECASE)
+HTTP_EQUIV_RE = re.compile(br'http-equiv\s*=\s*["\']?\s*content-type', re.IGNORECASE)
+XML_ENCODING_RE = re.compile(br'^<\?xml[^>]+encoding\s*=\s*["\']([a-z0-9_:.-]+)', re.IGNORECASE)
 
 
 def get_page_encoding(soup, default_encoding=None):
@@ -10,11 +27,70 @@ def get_page_encoding(soup, default_encoding=None):
     return default_encoding
 
 
+def lookup_encoding(encoding):
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return None
+
+
+def get_declared_encoding(match):
+    encoding = lookup_encoding(match.group(1).decode('ascii'))
+    # Document without BOM, having a declaration readable as ASCII, can't be UTF-16 or UTF-32.
+    if encoding and encoding.startswith(('utf-16', 'utf-32')):
+        return 'utf-8'
+    return encoding
+
+
+def detect_encoding(content, charset=None, scansize=4096):
+    """Detect encoding of an HTML or XML document without parsing it.
+
+    Encoding is taken from BOM, <meta http-equiv="Content-Type"> tag, charset of Content-Type header, XML declaration
+    or <meta charset> tag, in this order. <meta http-equiv> tag takes precedence over the header, same as in
+    get_page_encoding. Only first scansize bytes are scanned for declarations.
+
+    Returns None if encoding is not declared.
+    """
+    for bom, encoding in BOMS:
+        if content.startswith(bom):
+            return encoding
+
+    head = content[:scansize]
+    for meta in META_TAG_RE.findall(head):
+        match = META_CHARSET_RE.search(meta) if HTTP_EQUIV_RE.search(meta) else None
+        encoding = get_declared_encoding(match) if match else None
+        if encoding:
+            return encoding
+
+    if charset and lookup_encoding(charset):
+        return charset
+
+    match = XML_ENCODING_RE.match(head) or META_CHARSET_RE.search(head)
+    if match:
+        return get_declared_encoding(match)
+
+    return None
+
+
 def get_content(data, errors='strict'):
+    """Decode content of a downloaded page.
+
+    For HTML and XML documents, encoding is detected with detect_encoding. Documents, where declared encoding is missing
+    or wrong, are decoded using encoding detected by BeautifulSoup, in which case <meta http-equiv="Content-Type"> tag
+    also takes precedence over the header.
+    """
     headers = {k.lower(): v for k, v in data.get('headers', {}).items()}
     content_type_header = headers.get('content-type', '')
     content_type, params = cgi.parse_header(content_type_header)
     if content_type.lower() in ('text/html', 'text/xml'):
+        # Parsing whole document with BeautifulSoup is slow, so it is used only if encoding is not declared. Declared
+        # encoding is checked strictly, so that a wrong declaration falls back to BeautifulSoup whatever errors is.
+        encoding = detect_encoding(data['content'], params.get('charset'))
+        if encoding:
+            try:
+                return data['content'].decode(encoding)
+            except UnicodeDecodeError:
+                pass
         soup = bs4.BeautifulSoup(data['content'], 'lxml', from_encoding=data['encoding'])
         encoding = get_page_encoding(soup, soup.original_encoding)
         return data['content'].decode(encoding, errors)
@@ -8,7 +8,9 @@ zero_depth_bases = (str, bytes, Number, range, bytearray)
 
 def getsize(obj):
     """Recursively iterate to sum size of object & members."""
-    def inner(obj, _seen_ids=set()):
+    _seen_ids = set()
+
+    def inner(obj):
         obj_id = id(obj)
         if obj_id in _seen_ids:
             return 0
@@ -1,5 +1,8 @@
 from textwrap import dedent
 
+import pickle
+import lxml.html
+import lxml.etree
 import pytest
 import databot
 import databot.pipes
@@ -51,6 +54,27 @@ def test_css_not_fould_value_error(Html):
         qry(row)
 
 
+def test_invalid_selector(Html):
+    row = Html(['<p id="a">value-a</p>'])
+    with pytest.raises(ValueError):
+        html.Select(None, 'p[')(row)
+    with pytest.raises(ValueError):
+        html.Select(None, 'xpath:p[')(row)
+
+
+def test_compiled_selector_cache(Html):
+    row = Html(['<p id="a">value-a</p><p id="b">value-b</p>'])
+    html.compile_css.cache_clear()
+    qry = html.Select(['p:text'])
+    assert qry(row) == ['value-a', 'value-b']
+    assert qry(row) == ['value-a', 'value-b']
+    assert html.Select(['p:text'])(row) == ['value-a', 'value-b']
+    assert html.compile_css.cache_info().misses == 1
+    query = html.compile_css('/p#a@id')
+    assert query.selector.css == 'p#a'
+    assert query[1:] == (True, 'id', False, False, False)
+
+
 def test_css_multiple_values_error(Html):
     row = Html(['<p id="a">value-a</p><p id="b">value-b</p><p id="c">value-c</p>'])
     qry = html.Select(None, 'p:text')
@@ -348,14 +372,9 @@ def test_null(Html, freezetime):
               'id': 1,
               'key': 'http://exemple.com',
               'value': {'content': b'<div><p id="this"> p1 </p>/div>'},
-          }). Context:
+          }). Context: /html
 
-        <html>
-          <body>
-            <div><p id="this"> p1 </p>/div&gt;</div>
-          </body>
-        </html>
-    ''')
+        <html><body><div><p id="this"> p1 </p>/div&gt;</div></body></html>''')
 
     selector = html.Select(select('#wrong:text?').null().strip())
     assert selector(row) is None
@@ -421,3 +440,73 @@ def test_select_method(bot):
 
     selector = html.Select(this.value.xml.select([select('div p:text').cast(int)]))
     assert selector(row) == [1, 2, 3]
+
+
+def test_compile(Html):
+    row = Html([
+        '<div class="item"><a href="/1">One</a><span>1</span></div>'
+        '<div class="item"><a href="/2">Two</a></div>'
+    ])
+    query = [
+        '.item', (
+            'a@href', {
+                'title': databot.first(['a:text']),
+                'tags': databot.join(['span:text'], ['b:text']),
+                'score': databot.subst('span:text?', {'1': 'one'}, None),
+                'link': select('a@href').replace('/', '#'),
+            },
+        ),
+    ]
+    selector = html.Select(query)
+    selector.set_row(row)
+    assert selector(row) == selector.render(row, selector.html, query) == [
+        ('http://exemple.com/1', {'link': 'http:##exemple.com#1', 'score': 'one', 'tags': ['1'], 'title': 'One'}),
+        ('http://exemple.com/2', {'link': 'http:##exemple.com#2', 'score': None, 'tags': [], 'title': 'Two'}),
+    ]
+
+
+def test_compile_custom_call(Html):
+    class Upper(html.Call):
+        def __init__(self, query):
+            self.query = query
+
+        def __call__(self, select, row, node, many=False, single=True):
+            return select.render(row, node, self.query, many, single).upper()
+
+    row = Html(['<p>value</p>'])
+    assert html.Select(Upper('p:text'))(row) == 'VALUE'
+
+
+def test_selector_error_context(Html, mocker):
+    mocker.patch('databot.handlers.html.CONTEXT_SIZE', 40)
+    row = Html(['<div id="a"><p>1</p><!-- x --><p>2 &amp; 3</p>%s</div>' % ('<p>x</p>' * 100)])
+    selector = html.Select(['div', 'p:text'])
+    with pytest.raises(html.SelectorError) as e:
+        selector(row)
+    assert str(e.value) == (
+        "'p:text' returned more than one value: %r. Context: /html/body/div\n\n"
+        '<div id="a"><p>1</p><!-- x --><p>2 &amp;...'
+    ) % (['1', '2 & 3'] + ['x'] * 100)
+    assert str(pickle.loads(pickle.dumps(e.value))) == str(e.value)
+
+
+def test_format_context():
+    node = lxml.html.fromstring('<div id="a"><p>1</p><!-- x --><?pi y?><p>2 &amp; <b>3</b></p>tail</div>')
+    assert html.format_context(node) == lxml.etree.tostring(node, encoding='unicode')
+    assert html.format_context(node, 26) == '<div id="a"><p>1</p><!-- x...'
+
+
+def test_select_pickle(Html):
+    row = Html(['<p id="a">value-a</p><p id="b">value-b</p>'])
+    selector = pickle.loads(pickle.dumps(html.Select(['p@id'])))
+    assert selector(row) == ['a', 'b']
+
+
+def test_select_workers(bot):
+    p1 = bot.define('p1').append([
+        ('http://example.com/%d' % i, {'content': ('<h1>%d</h1>' % i).encode('utf-8')}) for i in range(3)
+    ])
+    p2 = bot.define('p2')
+    p2(p1).call(html.Select('h1:text', None), workers=2)
+    assert list(p2.keys()) == ['0', '1', '2']
+    assert p2(p1).errors.count() == 0
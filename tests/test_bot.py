@@ -21,6 +21,35 @@ def test_init_with_engine_instance():
     Bot(sa.create_engine('sqlite:///:memory:'))
 
 
+def test_init_sqlite_pragmas(tmpdir):
+    bot = Bot(str(tmpdir.join('data.db')), sqlite_pragmas=True)
+    assert bot.engine.execute('PRAGMA journal_mode').scalar() == 'wal'
+    assert bot.engine.execute('PRAGMA synchronous').scalar() == 1  # NORMAL
+    assert bot.engine.execute('PRAGMA temp_store').scalar() == 2  # MEMORY
+
+    bot = Bot(str(tmpdir.join('other.db')), sqlite_pragmas={'cache_size': -1000})
+    assert bot.engine.execute('PRAGMA journal_mode').scalar() == 'delete'
+    assert bot.engine.execute('PRAGMA cache_size').scalar() == -1000
+
+
+def test_init_sqlite_pragmas_transaction(tmpdir):
+    bot = Bot(str(tmpdir.join('data.db')), sqlite_pragmas=True)
+    pipe = bot.define('p1')
+    with bot.engine.begin() as conn:
+        pipe.append([1], conn=conn)
+        # Query on the engine must use its own connection, without seeing or ending the transaction above.
+        assert bot.engine.execute(pipe.table.count()).scalar() == 0
+        pipe.append([2], conn=conn)
+    assert list(pipe.keys()) == [1, 2]
+
+    with pytest.raises(ValueError):
+        with bot.engine.begin() as conn:
+            pipe.append([3], conn=conn)
+            bot.engine.execute(pipe.table.count()).scalar()
+            raise ValueError
+    assert list(pipe.keys()) == [1, 2]
+
+
 def test_define(bot):
     execute, pipes, pipe = bot.engine.execute, bot.models.pipes, bot.models.pipes.c.pipe
     bot.define('pipe')
@@ -1,7 +1,9 @@
+import pytest
 import sqlalchemy as sa
 
-from databot.bulkinsert import BulkInsert
-from databot.utils.objsize import getsize
+from databot.db.models import Models
+
+from databot.bulkinsert import BulkInsert, rowsize
 
 
 def test_bulk_insert(db):
@@ -11,7 +13,7 @@ def test_bulk_insert(db):
     def query():
         return [int(row[table.c.key]) for row in db.engine.execute(sa.select([table]))]
 
-    size = getsize({'key': '1', 'value': b'a'})
+    size = rowsize({'key': '1', 'value': b'a'})
     bulk = BulkInsert(db.engine, table, size * 2)
 
     bulk.append({'key': '1', 'value': b'a'})
@@ -25,3 +27,99 @@ def test_bulk_insert(db):
 
     bulk.save()
     assert query() == [1, 2, 3]
+
+
+def test_bulk_insert_maxrows(db):
+    table = db.models.get_data_table('t1')
+    db.meta.create_all(db.engine)
+
+    def query():
+        return [int(row[table.c.key]) for row in db.engine.execute(sa.select([table]))]
+
+    bulk = BulkInsert(db.engine, table, maxrows=2)
+    bulk.append({'key': '1', 'value': b'a'})
+    bulk.append({'key': '2', 'value': b'b'})
+    assert query() == []
+
+    bulk.append({'key': '3', 'value': b'c'})
+    assert query() == [1, 2]
+
+
+def test_rowsize():
+    assert rowsize({'key': 'abc', 'value': b'x' * 100, 'compression': None, 'created': 1}) == 103
+
+
+def test_bulk_insert_background(tmpdir):
+    engine = sa.create_engine('sqlite:///%s' % tmpdir.join('data.db'))
+    models = Models(sa.MetaData())
+    table = models.get_data_table('t1')
+    models.metadata.create_all(engine)
+
+    def query(conn=engine):
+        return [int(row[table.c.key]) for row in conn.execute(sa.select([table]))]
+
+    saved = []
+
+    def post_save(conn, offset):
+        # Rows are always inserted before post_save is called in the same transaction.
+        assert query(conn)[-1] == offset
+        saved.append(offset)
+
+    offset = 0
+    bulk = BulkInsert(engine, table, maxrows=2, background=True)
+    bulk.post_save(post_save, lambda: offset)
+    for i in range(1, 8):
+        bulk.append({'key': str(i), 'value': b'a'})
+        offset = i
+    bulk.save(post_save=True)
+    bulk.close()
+
+    assert query() == [1, 2, 3, 4, 5, 6, 7]
+    assert saved == [2, 4, 6, 7]
+
+
+def test_bulk_insert_background_error(tmpdir):
+    engine = sa.create_engine('sqlite:///%s' % tmpdir.join('data.db'))
+    models = Models(sa.MetaData())
+    table = models.get_data_table('t1')
+    models.metadata.create_all(engine)
+
+    saved = []
+    bulk = BulkInsert(engine, table, maxrows=1, background=True)
+    bulk.post_save(lambda conn, n: saved.append(n), lambda: len(saved))
+    bulk.append({'key': '1', 'value': b'a'})
+    bulk.append({'id': 1, 'key': '2', 'value': b'a'})  # duplicate primary key
+    bulk.append({'key': '3', 'value': b'a'})
+    bulk.save()
+
+    with pytest.raises(sa.exc.IntegrityError):
+        bulk.close()
+    assert saved == [0]
+
+
+def test_bulk_insert_transaction(db):
+    table = db.models.get_data_table('t1')
+    other = db.models.get_data_table('t2')
+    db.meta.create_all(db.engine)
+
+    def query(table):
+        return [row[table.c.key] for row in db.engine.execute(sa.select([table]))]
+
+    def post_save(conn):
+        raise RuntimeError('post_save failed')
+
+    bulk = BulkInsert(db.engine, table)
+    bulk.post_save(post_save)
+    bulk.append({'key': '1', 'value': b'a'})
+    bulk.append({'key': '2', 'value': b'b'}, table=other)
+    with pytest.raises(RuntimeError):
+        bulk.save()
+    assert query(table) == []
+    assert query(other) == []
+
+    bulk.post_save(lambda conn: None)
+    bulk.append({'key': '1', 'value': b'a'})
+    bulk.append({'key': '2', 'value': b'b'}, table=other)
+    bulk.save()
+    assert query(table) == ['1']
+    assert query(other) == ['2']
@@ -11,6 +11,8 @@ import textwrap
 import pandas as pd
 from textwrap import dedent
 
+import databot.testing
+
 from databot import Bot, define, task, this
 from databot.db import migrations
 from databot.db.models import Models
@@ -323,6 +325,29 @@ def test_show_target_errors(bot):
     ''')
 
 
+def test_show_target_errors_context(bot):
+    p1 = bot.define('p1').append('http://example.com/', {'content': b'<div><p>1</p><p>2</p></div><span>x</span>'})
+    p2 = bot.define('p2')
+    bot.main({'tasks': [task('p1', 'p2').select(['div', 'p:text'])]}, argv=['run', '-l', '0', '-f', '10'])
+    error = p2(p1).errors.last()
+    assert "'p:text' returned more than one value: ['1', '2']. Context: /html/body/div" in error.traceback
+
+    bot.main(argv=['show', 'p1', 'p2', '-e', '-x', 'content'])
+    assert bot.output.output.getvalue().endswith('\n'.join([
+        "- key: 'http://example.com/'",
+        '  value:',
+        '    {}',
+        '  context:',
+        '',
+        '    <div>',
+        '      <p>1</p>',
+        '      <p>2</p>',
+        '    </div>',
+        '',
+        '',
+    ]))
+
+
 def test_show_open(mocker, bot):
     run = mocker.patch('subprocess.run')
 
@@ -387,6 +412,26 @@ def test_tail(bot):
     ''')
 
 
+def test_head_exclude_value(bot):
+    bot.define('p1').append([(1, 'a'), (2, 'b'), (3, 'c')])
+    bot.main(argv=['head', 'p1', '-x', 'value', '-n', '2'])
+    assert bot.output.output.getvalue() == dedent('''\
+        - key: 1
+        - key: 2
+    ''')
+
+
+@pytest.mark.parametrize('command', ['head', 'tail'])
+def test_head_exclude_value_without_rawkey(bot, command):
+    p1 = bot.define('p1').append([(1, 'a'), (2, 'b')])
+    p1.engine.execute(p1.table.update().where(p1.table.c.id == 1).values(rawkey=None))
+    bot.main(argv=[command, 'p1', '-x', 'value'])
+    assert bot.output.output.getvalue() == dedent('''\
+        - key: 1
+        - key: 2
+    ''')
+
+
 def test_tail_include(bot):
     bot.define('p1').append([(1, {'a': 1, 'b': 2}), (2, {'b': 3})])
     bot.main(argv=['tail', 'p1', '-t', '-i', 'a,b'])
@@ -651,6 +696,22 @@ def test_compress(bot):
     assert bot.output.output.getvalue().startswith('\rcompress p1:   0%|          | 0/2')
 
 
+def test_compress_zstd(bot):
+    pytest.importorskip('zstandard')
+    pipe = bot.define('p1').append([(1, 'a'), (2, 'b')])
+    bot.main(argv=['-v0', 'compress', 'p1', '-c', 'zstd'])
+    assert [row.compression.name for row in pipe.rows()] == ['zstd', 'zstd']
+    assert list(pipe.items()) == [(1, 'a'), (2, 'b')]
+
+
+def test_train(bot):
+    pytest.importorskip('zstandard')
+    pipe = bot.define('p1', compress='zstd').append([(i, 'value %d' % i) for i in range(200)])
+    bot.main(argv=['-v0', 'train', 'p1', '-s', '1024'])
+    assert pipe.dictionary is not None
+    assert bot.output.output.getvalue() == 'Trained dictionary %d for p1 pipe.\n' % pipe.dictionary
+
+
 def test_decompress(bot):
     bot.define('p1').append([(1, 'a'), (2, 'b')]).compress()
     bot.main(argv=['decompress', 'p1'])
@@ -750,5 +811,53 @@ def test_run_error_limit_n(bot, capsys):
     assert task('p1', 'p2').errors.count()._eval(bot) == 2
 
 
+def test_run_shared_scan(bot):
+    bot.define('p1').append([('1', 'a'), ('2', 'b')])
+    bot.define('p2')
+    bot.define('p3')
+
+    tasks = [
+        task('p1', 'p2').select(this.value.upper()),
+        task('p1', 'p3').select(this.key),
+    ]
+
+    bot.main({'tasks': tasks}, argv=['run', '--shared-scan', '-l', '0'])
+    assert bot.shared_scan is True
+    assert list(bot.pipe('p2').keys()) == ['A', 'B']
+    assert list(bot.pipe('p3').keys()) == ['1', '2']
+
+
 def clean(text):
     return re.sub(r'( +)$', '', text, flags=re.MULTILINE)
+
+
+def test_run_background_writes(tmpdir):
+    bot = databot.Bot(str(tmpdir.join('data.db')), output=io.StringIO())
+    bot.define('p1').append([('1', 'a'), ('2', 'b'), ('3', 'c')])
+    bot.define('p2')
+
+    tasks = [task('p1', 'p2').call(databot.testing.ErrorHandler())]
+
+    bot.main({'tasks': tasks}, argv=['run', '--background-writes', '-l', '0'])
+    assert bot.background_writes is True
+    assert list(bot.pipe('p2').items()) == [('1', 'A'), ('2', 'B'), ('3', 'C')]
+    assert not bot.pipe('p2')(bot.pipe('p1')).is_filled()
+
+
+def test_run_workers(bot):
+    bot.define('p1').append([('1', 'a'), ('2', 'b'), ('3', 'c')])
+    bot.define('p2')
+
+    tasks = [task('p1', 'p2').call(databot.testing.ErrorHandler())]
+
+    bot.main({'tasks': tasks}, argv=['run', '--workers', '2', '-l', '0'])
+    assert bot.workers == 2
+    assert list(bot.pipe('p2').items()) == [('1', 'A'), ('2', 'B'), ('3', 'C')]
+
+
+def test_run_bot_options():
+    bot = databot.Bot('sqlite:///:memory:', output=io.StringIO(), workers=2, background_writes=True, shared_scan=True)
+    bot.main({'tasks': []}, argv=['run', '-l', '0'])
+    assert bot.workers == 2
+    assert bot.background_writes is True
+    assert bot.shared_scan is True
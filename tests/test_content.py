@@ -0,0 +1,60 @@
+import codecs
+
+import databot.utils.html
+
+from databot.utils.html import detect_encoding, get_content
+
+
+def html(content, content_type='text/html', encoding=None):
+    return {'headers': {'Content-Type': content_type}, 'encoding': encoding, 'content': content}
+
+
+def test_detect_encoding():
+    assert detect_encoding(b'<html></html>') is None
+    assert detect_encoding(codecs.BOM_UTF8 + b'<html></html>', 'latin-1') == 'utf-8-sig'
+    assert detect_encoding(codecs.BOM_UTF16_LE + '<html>'.encode('utf-16-le')) == 'utf-16'
+    assert detect_encoding(b'<meta charset="cp1257">', 'utf-8') == 'utf-8'
+    assert detect_encoding(b'<meta charset="cp1257">', 'unknown') == 'cp1257'
+    assert detect_encoding(b'<head><meta charset="windows-1257"></head>') == 'cp1257'
+    meta = b'<meta http-equiv="Content-Type" content="text/html; charset=UTF-8">'
+    assert detect_encoding(b'<head>' + meta + b'</head>') == 'utf-8'
+    assert detect_encoding(b'<head>' + meta + b'</head>', 'iso-8859-1') == 'utf-8'
+    assert detect_encoding(b'<head><meta content="text/html; charset=cp1257" http-equiv="content-type"></head>') == (
+        'cp1257'
+    )
+    assert detect_encoding(b'<?xml version="1.0" encoding="ISO-8859-13"?><meta charset="utf-8">') == 'iso8859-13'
+    assert detect_encoding(b'<meta charset="utf-16">') == 'utf-8'
+    assert detect_encoding(b' ' * 5000 + b'<meta charset="cp1257">') is None
+
+
+def test_get_content():
+    text = '<html><head><meta charset="cp1257"></head><body>ąčę</body></html>'
+    assert get_content(html(text.encode('cp1257'))) == text
+    assert get_content(html(text.encode('utf-8'), 'text/html; charset=utf-8')) == text
+    assert get_content(html(codecs.BOM_UTF8 + text.encode('utf-8'))) == text
+
+
+def test_get_content_header_conflicts_with_meta():
+    meta = '<meta http-equiv="Content-Type" content="text/html; charset=utf-8">'
+    text = '<html><head>%s</head><body>ąčę</body></html>' % meta
+    data = html(text.encode('utf-8'), 'text/html; charset=iso-8859-1', encoding='ISO-8859-1')
+    assert get_content(data) == text
+
+
+def test_get_content_fallback(mocker):
+    spy = mocker.spy(databot.utils.html, 'get_page_encoding')
+    text = '<html><body>ąčę</body></html>'
+    assert get_content(html(text.encode('utf-8'), encoding='utf-8')) == text
+    # Wrong charset in <meta> tag.
+    content = b'<meta charset="ascii">' + text.encode('utf-8')
+    assert get_content(html(content, encoding='utf-8')) == content.decode('utf-8')
+    assert spy.call_count == 2
+
+    spy.reset_mock()
+    get_content(html(b'<html><meta charset="utf-8"></html>'))
+    assert spy.call_count == 0
+
+    # Wrong declaration falls back to BeautifulSoup even if decoding errors are replaced.
+    spy.reset_mock()
+    assert get_content(html(content, encoding='utf-8'), errors='replace') == content.decode('utf-8')
+    assert spy.call_count == 1
@@ -1,3 +1,5 @@
+import databot.handlers.download
+
 from databot import task, this
 
 
@@ -152,3 +154,66 @@ def test_download_update(bot, requests):
             'foo': 'bar',
         },
     })]
+
+
+def test_download_workers(bot, requests):
+    urls = ['http://example.com/%d' % i for i in range(10)]
+    for url in urls:
+        requests.get(url, content=url.encode())
+
+    source = bot.define('source').append(urls)
+    target = bot.define('target')
+
+    target(source).download(workers=4, host_workers=2)
+
+    assert list(target.keys()) == urls
+    assert [value['content'] for value in target.values()] == [url.encode() for url in urls]
+    assert target(source).count() == 0
+
+
+def test_download_workers_errors(bot, requests):
+    urls = ['http://example.com/%d' % i for i in range(4)]
+    for url in urls:
+        requests.get(url, status_code=(404 if url.endswith('2') else 200))
+
+    source = bot.define('source').append(urls)
+    target = bot.define('target')
+
+    target(source).download(workers=2)
+
+    assert list(target.keys()) == [urls[0], urls[1], urls[3]]
+    assert list(target(source).errors.keys()) == [urls[2]]
+
+
+def test_download_list_workers(bot, requests):
+    urls = ['http://example.com/%d' % i for i in range(5)]
+    for url in urls:
+        requests.get(url)
+
+    assert list(bot.define('a').download(urls, workers=3).keys()) == urls
+
+
+def test_download_list_bot_workers(bot, requests, mocker):
+    urls = ['http://example.com/%d' % i for i in range(5)]
+    for url in urls:
+        requests.get(url)
+
+    bot.workers = 3
+    throttle = mocker.spy(databot.handlers.download, 'HostThrottle')
+    assert list(bot.define('a').download(urls).keys()) == urls
+    assert list(bot.define('b').download(urls, workers=0).keys()) == urls
+    assert throttle.call_count == 1
+
+
+def test_host_throttle(mocker):
+    from databot.handlers.download import HostThrottle
+
+    sleep = mocker.patch('time.sleep')
+    mocker.patch('time.monotonic', return_value=100)
+
+    throttle = HostThrottle(workers=2, delay=5)
+    for url in ['http://a.com/1', 'http://a.com/2', 'http://b.com/1', 'http://a.com/3']:
+        with throttle(url):
+            pass
+
+    assert [call[0][0] for call in sleep.call_args_list] == [0, 5, 0, 10]
@@ -43,6 +43,12 @@ def test_eval_args():
     )
 
 
+def test_eval_head():
+    expr = this.cast(int).apply(str)
+    assert expr._eval_head('42', 1) == (42, (Method(name='apply', args=(str,), kwargs={}),))
+    assert expr._evals == 1
+
+
 def test_op_eq():
     assert (this == 42)._eval(42) is True
     assert (this == 42)._eval(0) is False
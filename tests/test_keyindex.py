@@ -0,0 +1,21 @@
+from databot.db.serializers import serkey
+from databot.keyindex import KeySet, BloomFilter
+
+
+def test_key_set():
+    keys = KeySet()
+    keys.add(serkey(1))
+    assert serkey(1) in keys
+    assert serkey(2) not in keys
+    assert len(keys) == 1
+
+
+def test_bloom_filter():
+    keys = BloomFilter(10000)
+    for i in range(10000):
+        keys.add(serkey(i))
+    assert all(serkey(i) in keys for i in range(10000))
+    assert sum(serkey(i) in keys for i in range(10000, 20000)) < 50
+    assert keys.full() is False
+    keys.add(serkey(-1))
+    assert keys.full() is True
@@ -21,3 +21,15 @@ def test_main(tmpdir):
         '    1                 1  p1',
         '---------------------------------',
     ]
+
+
+def test_main_sqlite_performance(tmpdir):
+    maindb = str(tmpdir / 'main.db')
+    databot.Bot(maindb).define('p1').append([(1, 'a')])
+
+    output = io.StringIO()
+    main(['--sqlite-performance', maindb, 'show', 'p1'], output)
+    assert "'a'" in output.getvalue()
+
+    bot = databot.Bot(maindb)
+    assert bot.engine.execute('PRAGMA journal_mode').scalar() == 'wal'
@@ -2,8 +2,11 @@ import io
 import json
 import msgpack
 import pytest
+import sqlalchemy as sa
 
 import databot.db
+from databot.db.models import Compression
+from databot.db.serializers import serrow
 from databot.printing import Printer
 
 
@@ -275,3 +278,35 @@ def test_text_to_content_migration(db, Migration):
 
     value, = [row['value'] for row in db.engine.execute(table.select())]
     assert msgpack.loads(value, encoding='utf-8') == after
+
+
+def test_raw_key_migration(db, Migration):
+    migration, table = Migration(databot.db.migrations.RawKey)
+
+    db.engine.execute(table.insert(), serrow([1, 'a'], 'b', compression=Compression.gzip))
+    db.engine.execute(table.update().values(rawkey=None))
+    migration.migrate_data(table, 'p1')
+
+    rawkey, = [row['rawkey'] for row in db.engine.execute(table.select())]
+    assert msgpack.loads(rawkey, encoding='utf-8') == [1, 'a']
+
+
+def test_indexes_migration(db, Migration):
+    migration, table = Migration(databot.db.migrations.Indexes)
+    db.models.errors.create(db.engine)
+    for index in list(db.models.errors.indexes) + list(table.indexes):
+        if index.name != 'ix_t1_key':
+            index.drop(db.engine)
+
+    migration.migrate()
+    migration.migrate_data_table(table)
+
+    inspector = sa.engine.reflection.Inspector.from_engine(db.engine)
+    assert {(x['name'], tuple(x['column_names'])) for x in inspector.get_indexes('databoterrors')} == {
+        ('ix_databoterrors_state_id_row_id', ('state_id', 'row_id')),
+    }
+    assert {(x['name'], tuple(x['column_names'])) for x in inspector.get_indexes('t1')} == {
+        ('ix_t1_key', ('key',)),
+        ('ix_t1_created', ('created',)),
+        ('ix_t1_key_id', ('key', 'id')),
+    }
@@ -146,6 +146,29 @@ def test_errors_reversed(bot):
     assert errors == ['c', 'b']
 
 
+def test_errors_windows(bot, mocker):
+    mocker.patch('databot.pipes.INLIST_SIZE', 2)
+    p1, p2 = bot.pipe('p1'), bot.pipe('p2')
+
+    p2(p1).call(databot.testing.ErrorHandler(1, 2, 3))
+    p1.clean(key=2)
+
+    assert [err.row.value for err in p2(p1).errors()] == ['a', 'c']
+    assert [err.row.value for err in p2(p1).errors(reverse=True)] == ['c', 'a']
+
+
+def test_errors_many(bot):
+    # SQLite before 3.32 does not allow more than 999 values in a single IN (...) list.
+    assert databot.pipes.INLIST_SIZE <= 999
+    p1, p2 = bot.pipe('p1'), bot.pipe('p2')
+    p1.append([(i, 'x') for i in range(4, 1204)])
+
+    p2(p1).call(databot.testing.ErrorHandler(*range(1, 1204)))
+
+    assert p2(p1).errors.count() == 1203
+    assert [err.row.key for err in p2(p1).errors()] == list(range(1, 1204))
+
+
 def test_errors_last(bot):
     p1, p2 = bot.pipe('p1'), bot.pipe('p2')
 
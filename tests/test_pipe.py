@@ -3,8 +3,9 @@ import gzip
 import pytest
 import databot
 import databot.pipes
+import databot.bulkinsert
 
-from databot.db.serializers import serkey
+from databot.db.serializers import serkey, get_dictionary_id
 from databot.db.models import Compression
 from databot.pipes import ItemNotFound
 
@@ -73,6 +74,11 @@ def test_keys(t1):
     assert list(t1.keys()) == ['1', '2']
 
 
+def test_keys_without_rawkey(t1):
+    t1.engine.execute(t1.table.update().where(t1.table.c.id == 1).values(rawkey=None))
+    assert list(t1.keys()) == ['1', '2']
+
+
 def test_values(t1):
     assert list(t1.values()) == ['a', 'b']
 
@@ -152,6 +158,44 @@ def test_only_missing(p2):
     assert list(p2.keys()) == [1, 2, 3, 4]
 
 
+def test_only_missing_key_index(bot, mocker):
+    pipe = bot.define('p1').append([1, 2, 3])
+    exists = mocker.spy(pipe, '_exists')
+    pipe.append([1, 2, 3, 4, 4], only_missing=True)
+    pipe.append([4, 5], only_missing=True)
+    assert list(pipe.keys()) == [1, 2, 3, 4, 5]
+    assert exists.call_count == 0
+
+    pipe.clean()
+    pipe.append([1, 5], only_missing=True)
+    assert list(pipe.keys()) == [1, 5]
+
+
+def test_only_missing_bloom(bot):
+    pipe = bot.define('p1', bloom=True).append(list(range(100)))
+    pipe.append(list(range(50, 2000)), only_missing=True)
+    pipe.append(list(range(1990, 3000)), only_missing=True)
+    assert list(pipe.keys()) == list(range(3000))
+    assert pipe.get_keys().full() is False
+
+
+@pytest.mark.parametrize('bloom', [False, True])
+def test_only_missing_duplicates(bot, bloom):
+    pipe = bot.define('p1', bloom=bloom).append([1])
+    pipe.append([2, 2, 1, 3, 2], only_missing=True)
+    assert list(pipe.keys()) == [1, 2, 3]
+
+
+def test_only_missing_bloom_buffered(bot):
+    pipe = bot.define('p1', bloom=True)
+    bulk = databot.bulkinsert.BulkInsert(pipe.engine, pipe.table)
+    pipe.append(list(range(2000)), only_missing=True, bulk=bulk)
+    # Bloom filter is full and is loaded again, rows, that are not yet written, must not be lost.
+    pipe.append(list(range(1500, 2500)), only_missing=True, bulk=bulk)
+    bulk.save()
+    assert list(pipe.keys()) == list(range(2500))
+
+
 def test_append_none(bot):
     pipe = bot.define('p1').append([None, 1, None, 2, 3])
     assert list(pipe.keys()) == [1, 2, 3]
@@ -185,6 +229,87 @@ def test_compress_decompress(bot):
     assert list(pipe.items()) == [(1, 'a'), (2, 'b')]
 
 
+def test_compress_batches(bot, mocker):
+    pipe = bot.define('p1').append([(i, 'value %d' % i) for i in range(10)])
+    execute = mocker.spy(pipe, '_update_chunk')
+    pipe.compress(batchsize=3)
+    assert execute.call_count == 4
+    assert {row.compression for row in pipe.rows()} == {Compression.gzip}
+    assert list(pipe.items()) == [(i, 'value %d' % i) for i in range(10)]
+
+    # Already compressed rows are not updated again.
+    pipe.compress(batchsize=3)
+    assert execute.call_count == 4
+
+
+def test_compress_resume(bot, mocker):
+    pipe = bot.define('p1').append([(i, 'value %d' % i) for i in range(10)])
+    update_chunk = databot.pipes.Pipe._update_chunk
+    interrupt = True
+
+    def update_and_interrupt(self, update, params):
+        update_chunk(self, update, params)
+        if interrupt:
+            raise KeyboardInterrupt
+
+    mocker.patch.object(databot.pipes.Pipe, '_update_chunk', update_and_interrupt)
+    with pytest.raises(KeyboardInterrupt):
+        pipe.compress(batchsize=4)
+    assert [row.compression for row in pipe.rows()] == [Compression.gzip] * 4 + [None] * 6
+
+    interrupt = False
+    pipe.compress(batchsize=4)
+    assert [row.compression for row in pipe.rows()] == [Compression.gzip] * 10
+    assert list(pipe.items()) == [(i, 'value %d' % i) for i in range(10)]
+
+
+def test_compress_workers(bot):
+    pipe = bot.define('p1').append([(i, 'value %d' % i) for i in range(10)])
+    pipe.compress(workers=2, batchsize=3)
+    assert [row.compression for row in pipe.rows()] == [Compression.gzip] * 10
+    pipe.decompress(workers=2, batchsize=3)
+    assert [row.compression for row in pipe.rows()] == [None] * 10
+    assert list(pipe.items()) == [(i, 'value %d' % i) for i in range(10)]
+
+
+@pytest.mark.parametrize('compression,module', [('zstd', 'zstandard'), ('lz4', 'lz4')])
+def test_compression_algorithms(bot, compression, module):
+    pytest.importorskip(module)
+    pipe = bot.define('p1', compress=compression).append([(1, 'a'), (2, {'content': b'x' * 10000})])
+    assert pipe.compression is Compression[compression]
+    assert list(pipe.keys()) == [1, 2]
+    assert list(pipe.items()) == [(1, 'a'), (2, {'content': b'x' * 10000})]
+
+    pipe.compress('gzip')
+    assert [row.compression for row in pipe.rows()] == [Compression.gzip, Compression.gzip]
+
+    pipe.compress()
+    assert [row.compression for row in pipe.rows()] == [Compression[compression], Compression[compression]]
+    assert list(pipe.items()) == [(1, 'a'), (2, {'content': b'x' * 10000})]
+
+
+def test_train_dictionary(bot):
+    pytest.importorskip('zstandard')
+    html = '<html><head><title>Page %d</title></head><body>%s</body></html>'
+    pages = [(i, {'content': (html % (i, 'a' * (i % 7))).encode()}) for i in range(200)]
+    pipe = bot.define('p1', compress='zstd').append(pages)
+    dictionary = pipe.train(size=1024)
+    assert pipe.dictionary == dictionary
+
+    pipe.compress()
+    values = [row['value'] for row in bot.engine.execute(pipe.table.select())]
+    assert {get_dictionary_id(value) for value in values} == {dictionary}
+    assert list(pipe.items()) == pages
+    assert list(pipe.keys())[:2] == [0, 1]
+
+    pipe.append(200, 'new')
+    assert pipe.last().value == 'new'
+
+    # Dictionary is loaded when pipe is defined.
+    other = databot.Bot(bot.engine).define('p1', compress='zstd')
+    assert other.dictionary == dictionary
+
+
 def test_clean_key(bot):
     p1 = bot.define('p1').append([(1, 'a'), (2, 'b'), (2, 'c'), (3, 'd')])
 
@@ -232,3 +357,26 @@ def test_merge_dict_nested(bot):
     assert list(pipe.items()) == data + [
         (1, {'a': {'b': {'x': 1, 'y': 1}}}),
     ]
+
+
+def test_merge_windows(bot, mocker):
+    mocker.patch('databot.pipes.INLIST_SIZE', 2)
+    data = [
+        (1, {'a': 1}),
+        (2, {'a': 1}),
+        (3, {'a': 1}),
+        (2, {'b': 2}),
+        (4, {'a': 1}),
+        (3, {'b': 2}),
+        (1, {'b': 2}),
+        (5, 'x'),
+        (5, 'y'),
+    ]
+    pipe = bot.define('p1').append(data).merge()
+    items = list(pipe.items())
+    assert items[:len(data)] == data
+    assert sorted(items[len(data):], key=lambda x: x[0]) == [
+        (1, {'a': 1, 'b': 2}),
+        (2, {'a': 1, 'b': 2}),
+        (3, {'a': 1, 'b': 2}),
+    ]
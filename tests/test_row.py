@@ -1,5 +1,11 @@
+import pickle
+
+import databot.db.utils
+
 from databot import this
-from databot.db.utils import Row
+from databot.db.models import Compression
+from databot.db.serializers import serrow
+from databot.db.utils import Row, create_row
 
 
 def test_row():
@@ -57,3 +63,48 @@ def test_url():
     assert this.value.urlparse().path._eval(row) == '/path'
     assert this.value.urlparse().hostname._eval(row) == 'example.com'
     assert this.value.url()._eval(row) == 'http://example.com/path?key=42'
+
+
+def test_lazy_row(mocker):
+    loads = mocker.spy(databot.db.utils, 'loads')
+    row = dict(serrow('a', {'x': 1}, compression=Compression.gzip), id=1)
+    del row['rawkey']
+    row = create_row(row)
+
+    assert row.key == 'a'
+    assert row['key'] == 'a'
+    assert loads.call_count == 0
+
+    assert row.value == {'x': 1}
+    assert loads.call_count == 1
+    assert row == {'id': 1, 'key': 'a', 'value': {'x': 1}, 'compression': Compression.gzip}
+
+
+def test_lazy_row_as_dict():
+    row = create_row(dict(serrow('a', 'b'), id=1))
+    assert 'value' in row
+    assert dict(Row(row)) == {'id': 1, 'key': 'a', 'value': 'b', 'compression': None}
+
+
+def test_lazy_row_contains(mocker):
+    loads = mocker.spy(databot.db.utils, 'loads')
+    row = create_row(dict(serrow('a', 'b', compression=Compression.gzip), id=1))
+    loads.reset_mock()
+    assert 'key' in row
+    assert 'value' in row
+    assert 'id' in row
+    assert 'retries' not in row
+    assert loads.call_count == 0
+
+
+def test_lazy_row_pickle():
+    row = create_row(dict(serrow('a', 'b'), id=1))
+    assert pickle.loads(pickle.dumps(row)).value == 'b'
+
+
+def test_lazy_row_rawkey(mocker):
+    loads_key = mocker.spy(databot.db.utils, 'loads_key')
+    row = create_row(dict(serrow('a', 'b', compression=Compression.gzip), id=1))
+    assert row.key == 'a'
+    assert loads_key.call_count == 0
+    assert row.value == 'b'
@@ -1,6 +1,8 @@
 import pytest
 import freezegun
 
+import databot.handlers.html
+
 from databot import Bot, define, task, this
 from databot.expressions.base import ExpressionError
 
@@ -263,3 +265,37 @@ def test_run_freq():
 
     assert list(p1.keys()) == ['a', 'a']
     assert list(p2.keys()) == ['A', 'A']
+
+
+def test_run_shared_scan(mocker):
+    tasks = [
+        task('pages', 'titles').select(['h1:text']),
+        task('pages', 'links').select(['a@href']),
+        task('pages', 'missing').select('p:text'),
+        task('links', 'urls').select(this.key.upper()),
+    ]
+
+    bot = Bot()
+    bot.define('pages').append([
+        ('http://example.com/1', {'content': b'<h1>One</h1><a href="/2">2</a>'}),
+        ('http://example.com/2', {'content': b'<h1>Two</h1><a href="/3">3</a>'}),
+        ('http://example.com/3', {'content': b'<h1>Three</h1><p>3</p>'}),
+    ])
+    bot.define('titles')
+    bot.define('links')
+    bot.define('missing')
+    bot.define('urls')
+
+    # titles task has already processed first page.
+    bot.pipe('titles')(bot.pipe('pages')).offset(1)
+
+    parser = mocker.spy(databot.handlers.html, 'create_html_parser')
+    bot.commands.run(tasks, limits=[0], shared_scan=True)
+
+    assert parser.call_count == 3
+    assert list(bot.pipe('titles').keys()) == ['Two', 'Three']
+    assert list(bot.pipe('links').keys()) == ['http://example.com/2', 'http://example.com/3']
+    assert list(bot.pipe('missing').keys()) == ['3']
+    assert list(bot.pipe('urls').keys()) == ['HTTP://EXAMPLE.COM/2', 'HTTP://EXAMPLE.COM/3']
+    assert bot.pipe('missing')(bot.pipe('pages')).errors.count() == 2
+    assert not any(bot.pipe(name)(bot.pipe('pages')).is_filled() for name in ('titles', 'links', 'missing'))
@@ -1,6 +1,7 @@
 import pytest
 
-from databot.db.serializers import serkey
+from databot.db.models import Compression
+from databot.db.serializers import serkey, servalue, loads, loads_key, train_dictionary, register_dictionary
 
 
 def test_serkey():
@@ -14,3 +15,22 @@ def test_serkey():
 
     with pytest.raises(AssertionError):
         serkey({1: 2})
+
+
+@pytest.mark.parametrize('compression', list(Compression) + [None])
+def test_loads_key(compression):
+    if compression in (Compression.zstd, Compression.lz4):
+        pytest.importorskip({Compression.zstd: 'zstandard', Compression.lz4: 'lz4'}[compression])
+    value = servalue('key', {'content': b'x' * 100000}, compression)
+    assert loads_key(value, compression) == 'key'
+    assert loads_key(servalue([1, 2], None, compression), compression) == [1, 2]
+
+
+def test_dictionary():
+    pytest.importorskip('zstandard')
+    samples = [servalue(i, {'title': 'Page %d' % i, 'body': 'x' * (i % 10)}) for i in range(200)]
+    dictionary = register_dictionary(train_dictionary(samples, 1024))
+    value = servalue(1, {'title': 'Page 1', 'body': 'x'}, Compression.zstd, dictionary)
+    assert len(value) < len(servalue(1, {'title': 'Page 1', 'body': 'x'}, Compression.zstd))
+    assert loads(value, Compression.zstd) == [1, {'title': 'Page 1', 'body': 'x'}]
+    assert loads_key(value, Compression.zstd) == 1
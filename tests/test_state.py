@@ -1,5 +1,7 @@
 import pytest
 
+import databot.pipes
+
 
 @pytest.fixture
 def bot(bot):
@@ -39,3 +41,24 @@ def test_offset_skip_reset(bot):
     assert keys(task.offset(-1)) == [2, 3, 4, 5]
     assert keys(task.offset(-1)) == [1, 2, 3, 4, 5]
     assert keys(task.offset(-1)) == [1, 2, 3, 4, 5]
+
+
+def test_state_cache(bot, mocker):
+    a = bot.pipe('a')
+    b = bot.pipe('b')
+    task = b(a)
+    get_or_create = mocker.spy(databot.pipes, 'get_or_create')
+
+    task.count()
+    task.is_filled()
+    list(task.keys())
+    assert get_or_create.call_count == 1
+
+    task.offset(2)
+    assert task.count() == 3
+    assert task.count() == 3
+    assert get_or_create.call_count == 2
+
+    task.call(lambda row: [(row.key, row.value)])
+    assert task.count() == 0
+    assert task.get_state().offset == a.last().id
@@ -90,6 +90,37 @@ def test_compact(bot):
     assert t1.count() == 3
 
 
+def test_compact_incremental(bot, mocker):
+    mocker.patch('databot.pipes.INLIST_SIZE', 2)
+    t1 = bot.pipe('pipe 1')
+    t1.append([('1', 'a'), ('2', 'b'), ('2', 'c'), ('3', 'd'), ('3', 'e'), ('4', 'f'), ('4', 'g'), ('4', 'h')])
+    assert list(t1.compact(incremental=True).items()) == [('1', 'a'), ('2', 'c'), ('3', 'e'), ('4', 'h')]
+    assert t1._get_mark('compact') == t1.last().id
+
+    t1.append([('1', 'x'), ('5', 'y')])
+    assert list(t1.compact(incremental=True).items()) == [('2', 'c'), ('3', 'e'), ('4', 'h'), ('1', 'x'), ('5', 'y')]
+
+    t1.append('5', 'z')
+    assert list(t1.compact(incremental=True).items()) == [('2', 'c'), ('3', 'e'), ('4', 'h'), ('1', 'x'), ('5', 'z')]
+    assert t1._get_mark('compact') == t1.last().id
+
+
+def test_dedup_incremental(bot):
+    t1 = bot.pipe('pipe 1')
+    t1.append([('1', 'a'), ('2', 'b'), ('2', 'c')])
+    assert list(t1.dedup(incremental=True).items()) == [('1', 'a'), ('2', 'b')]
+
+    # Last row is deleted, so it's id will be reused by the next row.
+    t1.append('2', 'd')
+    assert list(t1.dedup(incremental=True).items()) == [('1', 'a'), ('2', 'b')]
+    t1.append('1', 'e')
+    assert list(t1.dedup(incremental=True).items()) == [('1', 'a'), ('2', 'b')]
+
+    t1.clean()
+    t1.append([('1', 'a'), ('1', 'b')])
+    assert list(t1.dedup(incremental=True).items()) == [('1', 'a')]
+
+
 def test_initial_state(bot):
     t1 = bot.pipe('pipe 1')
     t2 = bot.pipe('pipe 2')
@@ -1,7 +1,10 @@
 import io
 import textwrap
+import multiprocessing
 import pytest
 import pandas as pd
+import databot.testing
+import databot.bulkinsert
 
 from databot import this
 
@@ -35,6 +38,19 @@ def test_rows(task):
     assert [(x.key, x.value) for x in task.target(None).rows()] == []
 
 
+def test_keys(task):
+    assert list(task.keys()) == [1, 2, 3]
+    task.offset(2)
+    assert list(task.keys()) == [3]
+    assert list(task.target(None).keys()) == []
+
+
+def test_keys_without_rawkey(task):
+    table = task.source.table
+    task.source.engine.execute(table.update().values(rawkey=None))
+    assert list(task.keys()) == [1, 2, 3]
+
+
 def test_call_debug(bot):
     bot.debug = True
     bot.output.output = io.StringIO()
@@ -197,6 +213,21 @@ def test_retry_keyboard_interrupt(bot):
     assert list(p2.keys()) == [1]
 
 
+def test_retry_errors_in_bulk(bot, mocker):
+    p1 = bot.define('p1').append([(1, 'a'), (2, 'b'), (3, 'c')])
+    p2 = bot.define('p2')
+    task = p2(p1)
+    for row in p1.rows():
+        task.errors.report(row, 'Error')
+
+    execute = mocker.spy(databot.bulkinsert.BulkInsert, 'execute')
+    task.retry(databot.testing.ErrorHandler(1, 3))
+    assert execute.call_count == 2
+    assert list(p2.keys()) == [2]
+    assert [(e.row.key, e.retries) for e in task.errors()] == [(1, 1), (3, 1)]
+    assert 'ValueError' in task.errors.last().traceback
+
+
 def test_export_csv(tmpdir, bot):
     path = tmpdir.join('data.csv')
     bot.define('p1').append([(1, 'a'), (2, 'b'), (3, 'c')]).export(str(path))
@@ -243,3 +274,57 @@ def test_min(bot):
     assert list(p2.items()) == [
         (1, 'a')
     ]
+
+
+def test_call_workers(bot):
+    p1 = bot.define('p1').append(range(1, 251))
+    p2 = bot.define('p2')
+    p2(p1).call(handler, workers=2)
+    assert list(p2.keys()) == [x**2 for x in range(1, 251)]
+    assert p2(p1).count() == 0
+
+
+def test_call_workers_limit(bot):
+    bot.limit = 2
+    p1 = bot.define('p1').append([1, 2, 3])
+    p2 = bot.define('p2')
+    p2(p1).call(handler, workers=2)
+    assert list(p2.keys()) == [1, 4]
+    assert p2(p1).count() == 1
+
+
+def test_call_workers_errors(bot):
+    p1 = bot.define('p1').append([('1', 'a'), ('2', 'b'), ('3', 'c')])
+    p2 = bot.define('p2')
+    p2(p1).call(databot.testing.ErrorHandler('2'), workers=2)
+    assert list(p2.items()) == [('1', 'A'), ('3', 'C')]
+    assert list(p2(p1).errors.keys()) == ['2']
+    assert 'ValueError: Error.' in p2(p1).errors.last().traceback
+
+
+def test_call_workers_error_limit(bot):
+    p1 = bot.define('p1').append([('1', 'a'), ('2', 'b'), ('3', 'c')])
+    p2 = bot.define('p2')
+    with pytest.raises(ValueError):
+        p2(p1).call(databot.testing.ErrorHandler('2'), error_limit=1, workers=2)
+    assert list(p2.items()) == [('1', 'A')]
+    assert list(p2(p1).errors.keys()) == ['2']
+    assert [row.key for row in p2(p1).rows()] == ['2', '3']
+
+
+def test_call_workers_not_picklable(bot):
+    p1 = bot.define('p1').append([1, 2, 3])
+    p2 = bot.define('p2')
+    p2(p1).call(lambda row: [row.key**2], workers=2)
+    assert list(p2.keys()) == [1, 4, 9]
+    assert p2(p1).count() == 0
+
+
+def test_call_workers_keyboard_interrupt(bot):
+    p1 = bot.define('p1').append([1, 2, 3])
+    p2 = bot.define('p2')
+
+    with pytest.raises(KeyboardInterrupt):
+        p2(p1).call(interrupt, workers=2)
+
+    assert multiprocessing.active_children() == []
@@ -1,6 +1,6 @@
 import pytest
 
-from databot.db.windowedquery import windowed_query
+from databot.db.windowedquery import windowed_query, streamed_query, iter_query
 from databot.db.serializers import dumps
 
 
@@ -39,3 +39,38 @@ def test_even_windowsize(db, table):
     populate(db.engine, table, [1, 2, 3, 4, 5, 6])
     query = windowed_query(db.engine, table.select(), table.c.id, windowsize=2)
     assert keys(query) == [1, 2, 3, 4, 5, 6]
+
+
+def test_desc(db, table):
+    populate(db.engine, table, [1, 2, 3, 4, 5])
+    query = windowed_query(db.engine, table.select(), table.c.id.desc(), windowsize=2)
+    assert keys(query) == [5, 4, 3, 2, 1]
+
+
+def test_where(db, table):
+    populate(db.engine, table, [1, 2, 3, 4, 5, 6, 7])
+    query = windowed_query(db.engine, table.select(table.c.id > 2), table.c.id, windowsize=2)
+    assert keys(query) == [3, 4, 5, 6, 7]
+
+
+def test_empty(db, table):
+    query = windowed_query(db.engine, table.select(), table.c.id, windowsize=2)
+    assert keys(query) == []
+
+
+def test_streamed_query(db, table):
+    populate(db.engine, table, [1, 2, 3, 4, 5])
+    query = streamed_query(db.engine, table.select(), table.c.id, fetchsize=2)
+    assert keys(query) == [1, 2, 3, 4, 5]
+
+
+def test_streamed_query_desc(db, table):
+    populate(db.engine, table, [1, 2, 3])
+    query = streamed_query(db.engine, table.select(), table.c.id.desc(), fetchsize=2)
+    assert keys(query) == [3, 2, 1]
+
+
+def test_iter_query(db, table):
+    populate(db.engine, table, [1, 2, 3])
+    query = iter_query(db.engine, table.select(), table.c.id, windowsize=2)
+    assert keys(query) == [1, 2, 3]